@@ -4,7 +4,7 @@ import sip
 sip.setapi("QString", 2)
 
 from PyQt4 import QtGui
-from franq import Report, Band, DetailBand, DetailGroup, Label, Function, mm
+from franq import Report, Band, DetailBand, DetailGroup, Label, Field, mm
 
 
 class GroupedReport(Report):
@@ -21,9 +21,9 @@ class GroupedReport(Report):
                     elements=[
                         Label(top=0, left=0, height=5 * mm, width=10 * mm,
                             text=u"Type:"),
-                        Function(top=0 * mm, left=10 * mm,
+                        Field(top=0 * mm, left=10 * mm,
                             height=5 * mm, width=30 * mm,
-                            func=lambda r: r['type'])
+                            attrName='type')
                         ]
                     ),
                 Band(
@@ -42,9 +42,9 @@ class GroupedReport(Report):
                         Label(top=0, left=10 * mm,
                             height=5 * mm, width=12 * mm,
                             text=u"Sweet:"),
-                        Function(top=0 * mm, left=25 * mm,
+                        Field(top=0 * mm, left=25 * mm,
                             height=5 * mm, width=30 * mm,
-                            func=lambda r: r['sweet'])
+                            attrName='sweet')
                         ]
                     ),
                 Band(
@@ -57,8 +57,8 @@ class GroupedReport(Report):
                 ),
             ],
         elements=[
-            Function(top=0 * mm, left=40 * mm, height=5 * mm, width=30 * mm,
-                func=lambda r: r['name'])
+            Field(top=0 * mm, left=40 * mm, height=5 * mm, width=30 * mm,
+                attrName='name')
             ])
 
 app = QtGui.QApplication([])
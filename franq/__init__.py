@@ -16,5 +16,6 @@
 # You should have received a copy of the GNU General Public License
 # along with Franq; If not, see <http://www.gnu.org/licenses/>.
 from . franq import *
+from .datasource import *
 from .util import *
 __version__ = '0.9.10'
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Rendering from asyncio applications.
+
+    The report is rendered in a worker thread, so the event loop is never
+    blocked. Async iterators are consumed in the event loop, which puts
+    batches of rows into bounded queues read by the rendering thread, so
+    neither a slow source stalls the loop nor a fast one fills the memory.
+"""
+
+import asyncio
+import threading
+
+from .datasource import DataSource
+
+
+async def _produce(iterator, batches, batchSize):
+    try:
+        batch = []
+        async for row in iterator:
+            batch.append(row)
+            if len(batch) >= batchSize:
+                await batches.put(batch)
+                batch = []
+        if batch:
+            await batches.put(batch)
+        await batches.put(None)
+    except BaseException as e:
+        # Cancellation included, so the rendering thread never waits for
+        # batches that won't come. The error takes the place of batches
+        # not read yet if needed, as rendering stops at it anyway
+        while True:
+            try:
+                batches.put_nowait(e)
+                break
+            except asyncio.QueueFull:
+                batches.get_nowait()
+        if not isinstance(e, Exception):
+            raise
+
+
+class _BatchReader(object):
+    """
+        Reads from the rendering thread the batches put into a queue in the
+        event loop. Stopping it makes the thread stop waiting for them.
+    """
+
+    def __init__(self, batches, loop):
+        self._batches = batches
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending = None
+        self._stopped = False
+
+    def rows(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    raise asyncio.CancelledError()
+                self._pending = asyncio.run_coroutine_threadsafe(
+                    self._batches.get(), self._loop)
+            batch = self._pending.result()
+            if batch is None:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            for row in batch:
+                yield row
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._pending is not None:
+                self._pending.cancel()
+
+
+async def renderAsync(report, printer, dataSources, batchSize=100,
+        queueSize=4):
+    """
+        Renders report into printer in a worker thread, returning when done.
+
+        Datasets can be async iterators, which are consumed in the event loop
+        in batches of batchSize rows, with up to queueSize batches read
+        ahead. Any other dataset is used as in Report.render().
+
+        Cancelling it stops the rendering thread as soon as it waits for
+        rows of an async iterator.
+    """
+    loop = asyncio.get_running_loop()
+    producers = []
+    readers = {}
+    for name, dataSet in dataSources.items():
+        if hasattr(dataSet, '__aiter__'):
+            batches = asyncio.Queue(queueSize)
+            producers.append(loop.create_task(
+                _produce(dataSet.__aiter__(), batches, batchSize)))
+            readers[name] = _BatchReader(batches, loop)
+
+    def render():
+        # Data sources are created here, as they get the first row at once
+        sources = dict(dataSources)
+        for name, reader in readers.items():
+            sources[name] = DataSource(reader.rows())
+        report.render(printer, **sources)
+
+    try:
+        await loop.run_in_executor(None, render)
+    finally:
+        for reader in readers.values():
+            reader.stop()
+        for producer in producers:
+            producer.cancel()
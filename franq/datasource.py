@@ -0,0 +1,664 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from collections import deque
+import csv
+from itertools import islice
+import json
+import mmap
+from operator import itemgetter
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import threading
+
+
+# Whether data items of each type are mappings, see _accessor
+_mappingTypes = {}
+_accessors = {}
+
+
+def _isMapping(item):
+    isMapping = _mappingTypes.get(type(item))
+    if isMapping is None:
+        isMapping = _mappingTypes[type(item)] = isinstance(item, Mapping)
+    return isMapping
+
+
+def _partGetter(part):
+    if part.isdigit():
+        getKey = itemgetter(part)
+        getIndex = itemgetter(int(part))
+
+        def getter(item):
+            # Mappings can have number-like string keys, i.e. years
+            if _isMapping(item):
+                try:
+                    return getKey(item)
+                except KeyError:
+                    pass
+            try:
+                return getIndex(item)
+            except (IndexError, KeyError, TypeError):
+                raise AttributeError(part)
+    else:
+        getKey = itemgetter(part)
+
+        def getter(item):
+            if _isMapping(item):
+                try:
+                    return getKey(item)
+                except KeyError:
+                    raise AttributeError(part)
+            return getattr(item, part)
+    return getter
+
+
+def _accessor(path):
+    """
+        Returns a callable getting the value at a dotted path of a data item.
+        Each part of the path is an attribute name, a key when the item is
+        a mapping, or an index when the part is a number, so 'customer.name',
+        'customer.addresses.0.city' or just '2' for tuple items are valid.
+        Number parts are looked up in mappings as string keys first, so
+        'totals.2024' finds the '2024' key.
+
+        Accessors are compiled once for each path.
+    """
+    try:
+        return _accessors[path]
+    except KeyError:
+        pass
+    getters = [_partGetter(part) for part in path.split('.')]
+    if len(getters) == 1:
+        accessor = getters[0]
+    else:
+        def accessor(item):
+            for getter in getters:
+                item = getter(item)
+            return item
+    _accessors[path] = accessor
+    return accessor
+
+
+class DataSourceExausted(Exception):
+
+    pass
+
+
+class DataSource:
+    """
+        Cursor over a dataset, keeping the current and previous data items.
+
+        Properties
+        ----------
+        * position: int, index of the current data item.
+    """
+
+    def __init__(self, dataSet):
+        self._dataSet = dataSet
+        self._iterator = iter(dataSet)
+        self._ahead = deque()
+        self._prev = None
+        self._item = None
+        self.position = -1
+        try:
+            self.nextDataItem()
+        except DataSourceExausted:
+            pass
+
+    def getDataItem(self):
+        return self._item
+
+    def getPrevDataItem(self):
+        return self._prev
+
+    def nextDataItem(self):
+        self._prev = self._item
+        try:
+            if self._ahead:
+                self._item = self._ahead.popleft()
+            else:
+                self._item = next(self._iterator)
+        except StopIteration:
+            self._item = None
+            raise DataSourceExausted()
+        self.position += 1
+        return self._item
+
+    def peek(self, count):
+        """
+            Returns a list with up to count data items following the current
+            one, without moving to them.
+        """
+        while len(self._ahead) < count:
+            try:
+                self._ahead.append(next(self._iterator))
+            except StopIteration:
+                break
+        return list(islice(self._ahead, count))
+
+    def reiterate(self):
+        """
+            Returns a new iterator over all the data items, without moving
+            the data source. Raises ValueError if the dataset can be iterated
+            just once, like iterators do.
+        """
+        iterator = iter(self._dataSet)
+        if iterator is self._dataSet or iterator is self._iterator:
+            raise ValueError("The dataset can't be iterated twice")
+        return iterator
+
+    def close(self):
+        """ Releases any resource held, called when rendering ends """
+        pass
+
+
+class Record(dict):
+    """
+        Data item built by data sources from named values: a dict whose
+        values can be read as attributes as well.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class ColumnarRow(Mapping):
+    """
+        Data item of a ColumnarDataSource: a view of a row of its columns.
+        Values can be read both as keys and as attributes.
+    """
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, name):
+        return self._columns[name][self._index]
+
+    def __getattr__(self, name):
+        try:
+            return self._columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return 'ColumnarRow({})'.format(dict(self))
+
+
+class ColumnarDataSource(DataSource):
+    """
+        DataSource over columnar data: a NumPy structured array, or a mapping
+        of equal length sequences (i.e. NumPy arrays) by column name.
+
+        Data items are ColumnarRow views, reading the columns on demand, so
+        no row objects are built beforehand.
+
+        Properties
+        ----------
+        * columns: dict of sequences by column name.
+        * length: int, number of rows.
+    """
+
+    def __init__(self, dataSet):
+        names = _structuredNames(dataSet)
+        if names:
+            self.columns = {name: dataSet[name] for name in names}
+        else:
+            self.columns = dict(dataSet)
+        lengths = set(len(column) for column in self.columns.values())
+        if len(lengths) > 1:
+            raise ValueError('Columns must have the same length')
+        self.length = lengths.pop() if lengths else 0
+        DataSource.__init__(self, ())
+
+    def nextDataItem(self):
+        self._prev = self._item
+        if self.position + 1 >= self.length:
+            self._item = None
+            raise DataSourceExausted()
+        self.position += 1
+        self._item = ColumnarRow(self.columns, self.position)
+        return self._item
+
+    def peek(self, count):
+        start = self.position + 1
+        return [ColumnarRow(self.columns, index)
+            for index in range(start, min(start + count, self.length))]
+
+    def reiterate(self):
+        return (ColumnarRow(self.columns, index)
+            for index in range(self.length))
+
+    def sortedBy(self, names):
+        """
+            Returns a new ColumnarDataSource with the rows sorted by the
+            named columns, or None if any name isn't a column.
+        """
+        if any(name not in self.columns for name in names):
+            return None
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            order = numpy.lexsort([numpy.asarray(self.columns[name])
+                for name in reversed(names)])
+            return ColumnarDataSource({name: numpy.asarray(column)[order]
+                for name, column in self.columns.items()})
+        keys = [self.columns[name] for name in names]
+        order = sorted(range(self.length),
+            key=lambda i: tuple(key[i] for key in keys))
+        return ColumnarDataSource({name: [column[i] for i in order]
+            for name, column in self.columns.items()})
+
+    def groupSegments(self, names):
+        """
+            Returns, for each name, the list of row indexes where a group
+            starts when grouping by the columns up to that name, or None if
+            any name isn't a column.
+        """
+        levels = self.groupBreaks(names)
+        if levels is None:
+            return None
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            levels = numpy.array(levels)
+            levels[:1] = 0
+            return [numpy.flatnonzero(levels <= level).tolist()
+                for level in range(len(names))]
+        return [[i for i, l in enumerate(levels) if i == 0 or l <= level]
+            for level in range(len(names))]
+
+    def groupBreaks(self, names):
+        """
+            Returns, for each row, the index in names of the outermost column
+            whose value differs from the one in the previous row, or
+            len(names) if none does; or None if any name isn't a column.
+        """
+        if any(name not in self.columns for name in names):
+            return None
+        columns = [self.columns[name] for name in names]
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None and all(isinstance(column, numpy.ndarray)
+                for column in columns):
+            levels = numpy.full(self.length, len(names), dtype=numpy.intp)
+            # Inner levels first, so outer ones prevail
+            for level in range(len(names) - 1, -1, -1):
+                column = columns[level]
+                changed = numpy.zeros(self.length, dtype=bool)
+                changed[1:] = column[1:] != column[:-1]
+                levels[changed] = level
+            return levels.tolist()
+
+        levels = [len(names)] * self.length
+        for level in range(len(names) - 1, -1, -1):
+            column = columns[level]
+            for i in range(1, self.length):
+                if column[i] != column[i - 1]:
+                    levels[i] = level
+        return levels
+
+
+class CursorDataSource(DataSource):
+    """
+        DataSource over a DB-API cursor, fetching rows with fetchmany() in
+        a background thread, so fetching overlaps with rendering.
+
+        The cursor must allow being used from another thread, i.e. sqlite3
+        connections must be opened using check_same_thread=False.
+
+        Parameters
+        ----------
+        * cursor: DB-API cursor, with the query already executed.
+        * batchSize: int, rows fetched at once, default 500.
+        * queueSize: int, batches fetched ahead at most, default 4.
+        * records: bool, make Record data items, by column name, instead of
+            the rows returned by the cursor. Default False.
+    """
+
+    def __init__(self, cursor, batchSize=500, queueSize=4, records=False):
+        self._queue = queue.Queue(queueSize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fetch,
+            args=(cursor, batchSize, records))
+        self._thread.daemon = True
+        self._thread.start()
+        DataSource.__init__(self, self._rows())
+
+    def _put(self, batch):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _fetch(self, cursor, batchSize, records):
+        try:
+            names = None
+            while not self._stop.is_set():
+                rows = cursor.fetchmany(batchSize)
+                if not rows:
+                    break
+                if records:
+                    if names is None:
+                        names = [column[0] for column in cursor.description]
+                    rows = [Record(zip(names, row)) for row in rows]
+                self._put(rows)
+        except Exception as e:
+            self._put(e)
+        self._put(None)
+
+    def _rows(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            for row in batch:
+                yield row
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class _JoinedChildren(object):
+    """
+        Children of a JoinedParent: the rows of the joined stream sharing
+        the parent key, read from the stream as they are iterated.
+    """
+
+    def __init__(self, first, rows, key, getKey):
+        self._rows = rows
+        self._getKey = getKey
+        self._generator = self._children(first, key)
+        self.nextRow = None
+
+    def _children(self, first, key):
+        yield first
+        for row in self._rows:
+            if self._getKey(row) != key:
+                self.nextRow = row
+                return
+            yield row
+
+    def __iter__(self):
+        return self._generator
+
+    def skip(self):
+        """ Skips unread children, returns the first row of the next parent """
+        for row in self._generator:
+            pass
+        return self.nextRow
+
+
+class JoinedParent(object):
+    """
+        Data item of a JoinedDataSource. Values are taken from the first
+        joined row of the parent, and its children are available as an
+        iterable attribute.
+    """
+    __slots__ = ('_row', '_childrenName', '_children')
+
+    def __init__(self, row, childrenName, children):
+        self._row = row
+        self._childrenName = childrenName
+        self._children = children
+
+    def __getattr__(self, name):
+        if name == self._childrenName:
+            return self._children
+        if isinstance(self._row, Mapping):
+            try:
+                return self._row[name]
+            except KeyError:
+                raise AttributeError(name)
+        return getattr(self._row, name)
+
+    def __getitem__(self, name):
+        if name == self._childrenName:
+            return self._children
+        return self._row[name]
+
+
+class JoinedDataSource(DataSource):
+    """
+        DataSource splitting a stream of joined parent and child rows,
+        sorted by the parent key, into parent data items, each one with
+        an iterable of its children for use as a subdetail dataset.
+        Rows are read from the stream as needed, so memory use doesn't
+        depend on the size of the dataset.
+
+        Data items are JoinedParent objects, taking values from the first
+        row of each parent. Children are the joined rows themselves.
+
+        As children are read from the same stream, data items can't be
+        read ahead, so peek() always returns an empty list.
+
+        Parameters
+        ----------
+        * rows: iterable of joined rows, sorted by key.
+        * key: parent key, an attribute path or a callable receiving a row.
+        * children: str, name of the children attribute of the parent data
+            items, to be used as the subdetail dataSet. Default 'children'.
+    """
+
+    def __init__(self, rows, key, children='children'):
+        self._getKey = key if callable(key) else _accessor(key)
+        self._childrenName = children
+        DataSource.__init__(self, self._parents(iter(rows)))
+
+    def _parents(self, rows):
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        while row is not None:
+            children = _JoinedChildren(row, rows, self._getKey(row),
+                self._getKey)
+            yield JoinedParent(row, self._childrenName, children)
+            row = children.skip()
+
+    def peek(self, count):
+        return []
+
+    def reiterate(self):
+        raise ValueError("The dataset can't be iterated twice")
+
+
+class _FileDataSource(DataSource):
+    """
+        Base of the data sources reading rows from a memory mapped file.
+    """
+
+    def __init__(self, fileName, columns=None, types=None, encoding='utf-8'):
+        # No columns at all is taken as all of them, as fieldNames() finds
+        # none for reports reading data items by expressions only
+        self._columns = set(columns) if columns else None
+        self._types = types or {}
+        self._encoding = encoding
+        self._file = open(fileName, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        except ValueError:
+            self._map = None  # Empty files can't be mapped
+        DataSource.__init__(self, self._rows())
+
+    def _lines(self):
+        if self._map is None:
+            return
+        encoding = self._encoding
+        for line in iter(self._map.readline, b''):
+            yield line.decode(encoding)
+
+    def _fields(self, names):
+        """ Returns the names of the fields read and their converters """
+        if self._columns is not None:
+            names = [name for name in names if name in self._columns]
+        return names, [self._types.get(name) for name in names]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class CsvDataSource(_FileDataSource):
+    """
+        DataSource streaming Record data items from a CSV file with a header
+        row, so big files are rendered without loading them.
+
+        Parameters
+        ----------
+        * fileName: str, name of the file.
+        * columns: Names of the columns read, default, or if empty, all of
+            them. Report.fieldNames() returns the names a report needs.
+        * types: dict of converters, i.e. int or float, by column name.
+            Empty values of converted columns are read as None.
+        * encoding: str, file encoding, default 'utf-8'.
+        * Any other keyword arguments are csv.reader() formatting parameters,
+            i.e. delimiter.
+
+        Properties
+        ----------
+        * names: list of the names of the columns read.
+    """
+
+    def __init__(self, fileName, columns=None, types=None, encoding='utf-8',
+            **fmtparams):
+        self._fmtparams = fmtparams
+        self.names = []
+        _FileDataSource.__init__(self, fileName, columns, types, encoding)
+
+    def _rows(self):
+        reader = csv.reader(self._lines(), **self._fmtparams)
+        try:
+            header = next(reader)
+        except StopIteration:
+            return
+        self.names, converters = self._fields(header)
+        getters = [itemgetter(header.index(name)) for name in self.names]
+        fields = list(zip(self.names, getters, converters))
+        for row in reader:
+            if not row:
+                continue
+            record = Record()
+            for name, getter, converter in fields:
+                try:
+                    value = getter(row)
+                except IndexError:
+                    value = None
+                if converter is not None:
+                    value = converter(value) if value else None
+                record[name] = value
+            yield record
+
+
+class JsonLinesDataSource(_FileDataSource):
+    """
+        DataSource streaming Record data items from a JSON Lines file, one
+        JSON object by line, so big files are rendered without loading them.
+
+        Parameters
+        ----------
+        * fileName: str, name of the file.
+        * columns: Names of the keys read, default, or if empty, all of
+            them. Report.fieldNames() returns the names a report needs.
+        * types: dict of converters, i.e. decimal.Decimal, by key. None
+            values aren't converted.
+        * encoding: str, file encoding, default 'utf-8'.
+    """
+
+    def _rows(self):
+        converters = self._types
+        columns = self._columns
+        for line in self._lines():
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if columns is not None:
+                record = Record((name, obj.get(name)) for name in columns)
+            else:
+                record = Record(obj)
+            for name, converter in converters.items():
+                value = record.get(name)
+                if value is not None:
+                    record[name] = converter(value)
+            yield record
+
+
+def _structuredNames(dataSet):
+    dtype = getattr(dataSet, 'dtype', None)
+    return getattr(dtype, 'names', None)
+
+
+def _isColumn(value):
+    return (hasattr(value, '__len__') and hasattr(value, '__getitem__')
+        and not isinstance(value, (str, bytes, Mapping)))
+
+
+def _isColumnar(dataSet):
+    """
+        True for NumPy structured arrays and mappings whose values are all
+        sequences, but not for other mappings, i.e. a record.
+    """
+    if _structuredNames(dataSet):
+        return True
+    return (isinstance(dataSet, Mapping) and len(dataSet) > 0
+        and all(_isColumn(value) for value in dataSet.values()))
+
+
+def dataSource(dataSet):
+    """
+        Returns a DataSource for the dataset: DataSource objects are
+        returned as is, NumPy structured arrays and mappings of sequences
+        get a ColumnarDataSource, and any other iterable a plain DataSource.
+    """
+    if isinstance(dataSet, DataSource):
+        return dataSet
+    if _isColumnar(dataSet):
+        return ColumnarDataSource(dataSet)
+    return DataSource(dataSet)
@@ -17,11 +17,22 @@
 # along with Franq; If not, see <http://www.gnu.org/licenses/>.
 
 
-from PyQt5.QtCore import QPointF, QRectF, QSizeF, Qt
+from collections import namedtuple, OrderedDict
+import copy
+from itertools import groupby
+import os
+import threading
+
+from PyQt5.QtCore import QLineF, QPointF, QRectF, QSizeF, Qt
 from PyQt5.QtGui import (QPainter, QTextOption, QImage, QColor,
-    QTextDocument, QFontMetricsF)
+    QTextDocument, QFontMetricsF, QStaticText, QPicture, QTransform, QFont,
+    QPen, QBrush)
 from PyQt5.QtPrintSupport import QPrinter
 
+from .datasource import (DataSource, DataSourceExausted, dataSource,
+    _accessor)
+from .util import sortedItems
+
 
 _dpi = 300
 inch = _dpi
@@ -62,18 +73,24 @@ class BaseElement(object):
             self.__dict__[key] = value
 
     def renderSetup(self, painter):
+        if self.font or self.pen:
+            # The font and pen to restore are kept by the painter, as the
+            # same element can be rendered by several painters at once
+            _parentStates(painter).append((
+                painter.font() if self.font else None,
+                painter.pen() if self.pen else None))
         if self.font:
-            self.__parent_font = painter.font()
             painter.setFont(self.font)
         if self.pen:
-            self.__parent_pen = painter.pen()
             painter.setPen(self.pen)
 
     def renderTearDown(self, painter):
-        if self.font:
-            painter.setFont(self.__parent_font)
-        if self.pen:
-            painter.setPen(self.__parent_pen)
+        if self.font or self.pen:
+            font, pen = _parentStates(painter).pop()
+            if font is not None:
+                painter.setFont(font)
+            if pen is not None:
+                painter.setPen(pen)
 
     def _getBackground(self):
         return self.background
@@ -90,20 +107,443 @@ class BaseElement(object):
         except TypeError:
             border = (self.border,) * 4
 
-        pen = painter.pen()
+        lines = []
         if border[0]:
-            painter.setPen(border[0])
-            painter.drawLine(rect.topLeft(), rect.topRight())
+            lines.append((border[0], QLineF(rect.topLeft(), rect.topRight())))
         if border[1]:
-            painter.setPen(border[1])
-            painter.drawLine(rect.topRight(), rect.bottomRight())
+            lines.append((border[1],
+                QLineF(rect.topRight(), rect.bottomRight())))
         if border[2]:
-            painter.setPen(border[2])
-            painter.drawLine(rect.bottomLeft(), rect.bottomRight())
+            lines.append((border[2],
+                QLineF(rect.bottomLeft(), rect.bottomRight())))
         if border[3]:
-            painter.setPen(border[3])
-            painter.drawLine(rect.topLeft(), rect.bottomLeft())
-        painter.setPen(pen)
+            lines.append((border[3],
+                QLineF(rect.topLeft(), rect.bottomLeft())))
+        # A report painter draws the borders of a whole band at once
+        borderLines = getattr(painter, 'borderLines', None)
+        if borderLines is not None:
+            borderLines.extend(lines)
+        else:
+            _drawLines(painter, lines)
+
+
+def _parentStates(painter):
+    """ Stack of the (font, pen) to restore by renderTearDown() """
+    states = getattr(painter, 'parentStates', None)
+    if states is None:
+        states = painter.parentStates = []
+    return states
+
+
+def _drawLines(painter, lines):
+    """
+        Draws a list of (pen, QLineF) tuples, with a drawLines() call for
+        each pen, and drawing just once lines shared by adjacent borders.
+    """
+    groups = []
+    for pen, line in lines:
+        if not isinstance(pen, QPen):
+            pen = QPen(pen)
+        for groupPen, groupLines, drawn in groups:
+            if groupPen == pen:
+                break
+        else:
+            groupLines, drawn = [], set()
+            groups.append((pen, groupLines, drawn))
+        key = (line.x1(), line.y1(), line.x2(), line.y2())
+        if key not in drawn:
+            drawn.add(key)
+            groupLines.append(line)
+    if not groups:
+        return
+    pen = painter.pen()
+    for groupPen, groupLines, drawn in groups:
+        painter.setPen(groupPen)
+        painter.drawLines(groupLines)
+    painter.setPen(pen)
+
+
+class TextMetricsCache(object):
+    """
+        LRU cache of text heights, keyed by font, width, flags and text,
+        so repeated values are measured just once.
+
+        Properties
+        ----------
+        * maxSize: int, maximum number of heights kept, default 10000.
+        * hits: int, number of heights found in the cache.
+        * misses: int, number of heights measured.
+    """
+
+    def __init__(self, maxSize=10000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._heights = OrderedDict()
+        self._lock = threading.Lock()
+
+    def height(self, font, width, flags, text):
+        key = (font.key(), width, int(flags), text)
+        with self._lock:
+            height = self._heights.get(key)
+            if height is not None:
+                self.hits += 1
+                self._heights.move_to_end(key)
+                return height
+        height = _textHeight(font, width, flags, text)
+        with self._lock:
+            self.misses += 1
+            self._heights[key] = height
+            if len(self._heights) > self.maxSize:
+                self._heights.popitem(last=False)
+        return height
+
+
+class TextDocumentCache(object):
+    """
+        LRU cache of laid out rich text documents, keyed by html, font and
+        width, so the same document is used for measuring and painting, and
+        repeated values are parsed and laid out just once.
+        Documents dropped from the cache are pooled for laying out others.
+
+        Properties
+        ----------
+        * maxSize: int, maximum number of documents kept, default 500.
+        * hits: int, number of documents found in the cache.
+        * misses: int, number of documents laid out.
+    """
+
+    def __init__(self, maxSize=500):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._pool = []
+
+    def document(self, html, font, width, device):
+        key = (html, font.key(), width, device.logicalDpiY())
+        doc = self._documents.get(key)
+        if doc is not None:
+            self.hits += 1
+            self._documents.move_to_end(key)
+            return doc
+        self.misses += 1
+        doc = self._pool.pop() if self._pool else QTextDocument()
+        _layoutDocument(doc, html, font, width, device)
+        self._documents[key] = doc
+        if len(self._documents) > self.maxSize:
+            self._pool.append(self._documents.popitem(last=False)[1])
+        return doc
+
+
+class StaticTextCache(object):
+    """
+        LRU cache of laid out plain texts, as QStaticText objects, keyed by
+        text, font, width and text options, so repeated values like captions
+        or codes are laid out just once.
+
+        Properties
+        ----------
+        * maxSize: int, maximum number of texts kept, default 2000.
+        * hits: int, number of texts found in the cache.
+        * misses: int, number of texts laid out.
+    """
+
+    def __init__(self, maxSize=2000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._texts = OrderedDict()
+
+    def staticText(self, text, font, width, textOptions):
+        key = (text, font.key(), width, int(textOptions.alignment()),
+            int(textOptions.wrapMode()), int(textOptions.flags()))
+        staticText = self._texts.get(key)
+        if staticText is not None:
+            self.hits += 1
+            self._texts.move_to_end(key)
+            return staticText
+        self.misses += 1
+        staticText = QStaticText(text.replace('\n', u'\u2028'))
+        staticText.setTextFormat(Qt.PlainText)
+        staticText.setTextWidth(width)
+        staticText.setTextOption(textOptions)
+        staticText.prepare(QTransform(), font)
+        self._texts[key] = staticText
+        if len(self._texts) > self.maxSize:
+            self._texts.popitem(last=False)
+        return staticText
+
+    def draw(self, painter, rect, text, textOptions):
+        """ Draws text as painter.drawText(rect, text, textOptions) does """
+        staticText = self.staticText(text, painter.font(), rect.width(),
+            textOptions)
+        top = rect.top()
+        alignment = textOptions.alignment()
+        if alignment & (Qt.AlignBottom | Qt.AlignVCenter):
+            # QStaticText knows nothing about the height
+            free = rect.height() - staticText.size().height()
+            top += free if alignment & Qt.AlignBottom else free / 2
+        painter.drawStaticText(QPointF(rect.left(), top), staticText)
+
+
+class PictureCache(object):
+    """
+        Static elements of bands, recorded once into a QPicture and replayed
+        wherever the band is rendered again, see Band.recordStatic.
+
+        Properties
+        ----------
+        * hits: int, number of pictures replayed.
+        * misses: int, number of pictures recorded.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._pictures = {}
+
+    def draw(self, painter, band, elements, rect, data_item):
+        pen = painter.pen()
+        key = (band, elements, painter.font().key(), pen.color().rgba(),
+            pen.widthF())
+        entry = self._pictures.get(key)
+        if entry is None:
+            self.misses += 1
+            picture = QPicture()
+            recorder = _PictureRecorder(picture, painter)
+            origin = QRectF(0.0, 0.0, rect.width(), rect.height())
+            for element in elements:
+                element.render(recorder, origin, data_item)
+            recorder.end()
+            entry = self._pictures[key] = (picture, recorder.scaleX,
+                recorder.scaleY)
+        else:
+            self.hits += 1
+        picture, scaleX, scaleY = entry
+        painter.save()
+        painter.translate(rect.topLeft())
+        painter.scale(1.0 / scaleX, 1.0 / scaleY)
+        picture.play(painter)
+        painter.restore()
+
+
+class _PictureRecorder(QPainter):
+    """
+        Painter recording into a QPicture for replaying on the device of
+        another painter.
+
+        A QPicture is replayed scaled by the ratio between the device
+        resolution and its own, so it's replayed unscaled by that ratio,
+        and fonts sized in points, which are resolved for the picture,
+        are recorded enlarged by it. Elements get the fonts they set.
+    """
+
+    def __init__(self, picture, painter):
+        super(_PictureRecorder, self).__init__(picture)
+        device = painter.device()
+        self.scaleX = device.logicalDpiX() / float(picture.logicalDpiX())
+        self.scaleY = device.logicalDpiY() / float(picture.logicalDpiY())
+        self.renderer = getattr(painter, 'renderer', None)
+        self.context = getattr(painter, 'context', None)
+        self.textMetrics = getattr(painter, 'textMetrics', None)
+        self._font = None
+        self.setFont(painter.font())
+        self.setPen(painter.pen())
+        self.setBrush(painter.brush())
+
+    def font(self):
+        return self._font
+
+    def setFont(self, font):
+        self._font = QFont(font)
+        if font.pointSizeF() > 0:
+            font = QFont(font)
+            font.setPointSizeF(font.pointSizeF() * self.scaleY)
+        super(_PictureRecorder, self).setFont(font)
+
+
+class ImageCache(object):
+    """
+        LRU cache of images loaded from files, keyed by file name,
+        modification time and size, shared by all the reports. Images are
+        decoded once, and scaled down to the size they are printed at, so
+        big images don't get into the output at full resolution.
+
+        Properties
+        ----------
+        * maxBytes: int, maximum memory used by the images kept,
+            default 64 MB.
+        * hits: int, number of images found in the cache.
+        * misses: int, number of images decoded or scaled.
+    """
+
+    def __init__(self, maxBytes=64 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self.hits += 1
+                self._images.move_to_end(key)
+            return image
+
+    def _put(self, key, image):
+        with self._lock:
+            self.misses += 1
+            if key in self._images:
+                return self._images[key]
+            self._images[key] = image
+            self._bytes += image.byteCount()
+            while self._bytes > self.maxBytes and len(self._images) > 1:
+                self._bytes -= self._images.popitem(last=False)[1].byteCount()
+        return image
+
+    def image(self, fileName, width, height):
+        """
+            Returns the image in fileName for drawing it into a width by
+            height pixels rectangle, scaled down when larger.
+        """
+        try:
+            mtime = os.path.getmtime(fileName)
+        except OSError:
+            mtime = None
+        width, height = int(round(width)), int(round(height))
+        key = (fileName, mtime, width, height)
+        image = self._get(key)
+        if image is not None:
+            return image
+        original = self._get((fileName, mtime))
+        if original is None:
+            original = self._put((fileName, mtime), QImage(fileName))
+        image = _scaledDown(original, width, height)
+        if image is original:
+            return original
+        return self._put(key, image)
+
+
+imageCache = ImageCache()
+
+
+def _scaledDown(image, width, height):
+    """ Returns image scaled down to width by height pixels if larger """
+    if (image.isNull() or width <= 0 or height <= 0 or
+            (image.width() <= width and image.height() <= height)):
+        return image
+    return image.scaled(min(width, image.width()),
+        min(height, image.height()), Qt.IgnoreAspectRatio,
+        Qt.SmoothTransformation)
+
+
+def _decodeImage(source, width, height):
+    """
+        Returns the image of a file name, encoded image data or a QImage,
+        scaled down to width by height pixels if larger.
+    """
+    if isinstance(source, QImage):
+        return _scaledDown(source, width, height)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _scaledDown(QImage.fromData(bytes(source)), width, height)
+    return imageCache.image(source, width, height)
+
+
+class ImageDecoder(object):
+    """
+        Decodes the images of ImageField elements in a pool of threads,
+        ahead of painting them, keeping the latest ones.
+
+        Properties
+        ----------
+        * maxSize: int, maximum number of images kept, default 64.
+        * workers: int, number of decoding threads, default 4.
+    """
+
+    def __init__(self, maxSize=64, workers=4):
+        self.maxSize = maxSize
+        self.workers = workers
+        # Images, or futures of the images being decoded, by key
+        self._images = OrderedDict()
+        # (source, bytes) of the latest bytearray and memoryview sources
+        self._buffers = OrderedDict()
+        self._executor = None
+
+    def _key(self, source, width, height):
+        if isinstance(source, (bytearray, memoryview)):
+            # Copied into bytes once, not on each lookup
+            buffered = self._buffers.get(id(source))
+            if buffered is None or buffered[0] is not source:
+                buffered = self._buffers[id(source)] = (source,
+                    bytes(source))
+                while len(self._buffers) > self.maxSize:
+                    self._buffers.popitem(last=False)
+            source = buffered[1]
+        return (source, int(round(width)), int(round(height)))
+
+    def prefetch(self, source, width, height):
+        """ Starts decoding the image of source, if not done yet """
+        if isinstance(source, QImage):
+            return
+        key = self._key(source, width, height)
+        if key in self._images:
+            return
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(self.workers)
+        self._images[key] = self._executor.submit(_decodeImage, *key)
+        self._evict()
+
+    def _evict(self):
+        # Oldest images were already painted, or they will be decoded again
+        while len(self._images) > self.maxSize:
+            image = self._images.popitem(last=False)[1]
+            if not isinstance(image, QImage):
+                image.cancel()
+
+    def image(self, source, width, height):
+        """ Returns the image of source, waiting for it if decoding """
+        if isinstance(source, QImage):
+            return _scaledDown(source, int(round(width)), int(round(height)))
+        key = self._key(source, width, height)
+        image = self._images.get(key)
+        if image is None:
+            image = _decodeImage(*key)
+        elif not isinstance(image, QImage):
+            image = image.result()
+        else:
+            return image
+        self._images[key] = image
+        # Images not prefetched, like those outside detail bands, count too
+        self._evict()
+        return image
+
+    def close(self):
+        """ Stops decoding, called when painting ends """
+        if self._executor is not None:
+            for image in self._images.values():
+                if not isinstance(image, QImage):
+                    image.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._images.clear()
+        self._buffers.clear()
+
+
+def _layoutDocument(doc, html, font, width, device):
+    doc.documentLayout().setPaintDevice(device)
+    doc.setDefaultFont(font)
+    doc.setTextWidth(width)
+    doc.setHtml(html)
+
+
+def _textHeight(font, width, flags, text):
+    fm = QFontMetricsF(font)
+    return fm.boundingRect(QRectF(0.0, 0.0, width, 0.0), flags, text).height()
 
 
 class Report(BaseElement):
@@ -121,6 +561,9 @@ class Report(BaseElement):
             as multipliers
         * headerInFirstPage: Boolean, default True
         * footerInLastPage: Boolean, default True
+        * textMetrics: TextMetricsCache for measuring texts, default None,
+            meaning a new one for each render. Setting it allows sharing
+            measures between renders, and checking its hit/miss counters.
 
         * title: Report title, default None
         * begin: Starting Band, default None
@@ -130,6 +573,10 @@ class Report(BaseElement):
             DetailBand, default None.
         * footer: Band for page footers, default None
         * summary: Final band, default None
+        * context: RenderContext of the render of the report in progress in
+            the current thread, or None. Read only.
+        * renderer: ReportRenderer of that render, or None, telling the
+            page and pageCount as well. Read only.
     """
     title = None
 
@@ -146,6 +593,7 @@ class Report(BaseElement):
     headerInFirstPage = True
     footerInLastPage = True
     dataSet = None
+    textMetrics = None
 
     def __init__(self, properties=None, begin=None, header=None,
             detail=None, sections=None, footer=None, summary=None):
@@ -180,7 +628,7 @@ class Report(BaseElement):
         for section in self.sections:
             for i, detail in enumerate(section.detailBands):
                 if detail is not None and not isinstance(detail, Band):
-                    section[i] = detail()
+                    section.detailBands[i] = detail()
         if self.footer is not None and not isinstance(self.footer, Band):
             self.footer = self.footer()
         if self.summary is not None and not isinstance(self.summary, Band):
@@ -189,11 +637,138 @@ class Report(BaseElement):
     def setup(self):
         pass
 
+    def _bands(self):
+        """ Yields every band of the report, including nested ones """
+        for band in (self.begin, self.header, self.footer, self.summary):
+            if band is not None:
+                for b in band._bands():
+                    yield b
+        for section in self.sections:
+            for band in section.detailBands:
+                for b in band._bands():
+                    yield b
+
+    def fieldNames(self, dataSet=None):
+        """
+            Returns the set of names read from the data items of a named
+            dataset, by default the report one, by Field elements, groups
+            and aggregates, i.e. the columns a file data source must parse.
+            Just the first part of dotted paths is returned, and names read
+            by expressions can't be found out.
+        """
+        dataSet = dataSet or self.dataSet
+        bands = []
+        aggregates = []
+        if dataSet == self.dataSet:
+            for band in (self.begin, self.header, self.footer, self.summary):
+                if band is not None:
+                    bands += band._bands()
+        for section in self.sections:
+            for band in section.detailBands:
+                if (getattr(band, 'dataSet', None) or self.dataSet) != dataSet:
+                    continue
+                if not isinstance(band, DetailBand):
+                    bands += band._bands()
+                    continue
+                nested = set(b for subdetail in band.subdetails
+                    for b in subdetail._bands())
+                bands += [b for b in band._bands() if b not in nested]
+                aggregates += band.aggregates + band.pageAggregates
+                for group in band.groups:
+                    aggregates += group.aggregates
+                    if group.attrName is not None:
+                        aggregates.append(group)
+        names = set(item.attrName for item in aggregates
+            if item.attrName is not None)
+        for band in bands:
+            for element in band.elements:
+                attrName = getattr(element, 'attrName', None)
+                if isinstance(attrName, str):
+                    names.add(attrName)
+        return set(name.split('.')[0] for name in names)
+
+    def _plan(self):
+        """
+            Returns a new RenderPlan of the report. Bands can be changed
+            between renders, so it's called once for each render.
+        """
+        return RenderPlan(self)
+
+    @property
+    def context(self):
+        context = _currentContext()
+        if context is not None and context.renderer._report is self:
+            return context
+        return None
+
+    @property
+    def renderer(self):
+        context = self.context
+        return context.renderer if context is not None else None
+
     def render(self, printer, **dataSources):
+        # The page count is known only after the layout of the whole
+        # report, so lay it out first and then just paint it
+        plan = self._plan()
+        if plan.usesPageCount:
+            layout = LayoutRenderer(self, plan, keepDataItems=False).layout(
+                dataSources, printer)
+            LayoutPainter(self, plan).paint(printer, layout)
+            return
+
+        ReportRenderer(self, plan).render(printer, dataSources)
+
+    def renderParallel(self, printer, processes=None, **dataSources):
+        """
+            Renders the report into a PDF printer using several processes:
+            the report is laid out once, and then page ranges are painted
+            by a pool of processes, default one per CPU, and joined into
+            the printer's output file. Requires pypdf.
+
+            Processes are forked, so don't use it while other threads of the
+            process are running, see franq.parallel.
+
+            Returns the ReportLayout.
+        """
+        from .parallel import renderParallel
+        return renderParallel(self, printer, dataSources, processes)
+
+    def render_async(self, printer, **dataSources):
+        """
+            Returns a coroutine rendering the report in a worker thread, for
+            asyncio applications. Datasets can be async iterators, consumed
+            in the event loop while rendering, see franq.aio.
+        """
+        from .aio import renderAsync
+        return renderAsync(self, printer, dataSources)
 
-        self.renderer = ReportRenderer(self)
-        self.renderer.render(printer, dataSources)
-        self.renderer = None
+    def layout(self, **dataSources):
+        """
+            Performs the layout pass of the report only, placing every band
+            without painting anything.
+
+            Returns a ReportLayout, which can be painted later, several times
+            and/or partially, using paint().
+        """
+        return LayoutRenderer(self).layout(dataSources)
+
+    def paginate(self, **dataSources):
+        """
+            Dry run of the report: bands are only measured and placed, so
+            it's a lot cheaper than render().
+
+            Returns a ReportLayout, usable as a page map: it tells the page
+            count and the page and position of every band placed, along
+            with the data item printed, see ReportLayout.placements().
+        """
+        return self.layout(**dataSources)
+
+    def paint(self, printer, layout):
+        """
+            Paints a ReportLayout obtained from layout() into the printer.
+            Only the pages in the printer's fromPage/toPage range are painted.
+        """
+        LayoutPainter(self).paint(printer, layout)
 
 
 class Section(object):
@@ -221,61 +796,343 @@ class Section(object):
             self.__dict__[key] = value
 
 
-class DataSourceExausted(Exception):
-
+class LastPageReached(Exception):
+    """ Exception class used to finish rendering if last page selected is reached """
     pass
 
 
-class DataSource:
+class RenderPlan(object):
+    """
+        The structure of a report, compiled for rendering it: what would be
+        found out again for each band on every row.
 
-    def __init__(self, dataSet):
-        self._iterator = iter(dataSet)
-        self._prev = None
-        self._item = None
-        try:
-            self.nextDataItem()
-        except DataSourceExausted:
-            pass
+        Bands can be changed between renders, so each render compiles its
+        own plan, see Report._plan(). Plans are read only, so the layout and
+        paint passes of a render share them.
+
+        Properties
+        ----------
+        * bands: tuple of every band of the report.
+        * usesPageCount: bool, any element prints the page count.
+        * dataSets: dict of the dataset name of each band having one.
+        * elementRuns: dict of the elements of each band, as a tuple of runs
+            of consecutive static or dynamic elements, as (static, elements)
+            tuples.
+        * columnHeaders, columnFooters: dict of the column header and footer
+            bands of each detail band having them.
+        * subdetails: dict of the subdetails of each detail band, as
+            (band, isDetailBand) tuples.
+        * sectionBands: dict of the bands of each section, as (band,
+            isDetailBand) tuples.
+        * imageFields: dict of the ImageField elements of each band having
+            them, including those of its children.
+        * placedTexts: dict of the text elements of each band having them
+            whose text is found when laying out the band, see LayoutItem,
+            i.e. all of them but those printing the page count.
+        * dataItemBands: frozenset of the bands needing the data item for
+            painting a laid out band, including its children, as some of
+            their elements aren't text elements found when laying it out.
+        * pageAggregates: tuple of every page Aggregate.
+        * groups: tuple of every DetailGroup.
+    """
+
+    def __init__(self, report):
+        self.bands = bands = tuple(report._bands())
+        self.usesPageCount = any(_usesPageCount(element)
+            for band in bands for element in band.elements)
+        self.dataSets = {band: band.dataSet for band in bands
+            if band.dataSet is not None}
+        self.elementRuns = {}
+        self.columnHeaders = {}
+        self.columnFooters = {}
+        self.subdetails = {}
+        self.imageFields = {}
+        self.placedTexts = {}
+        pageAggregates = []
+        groups = []
+        for band in bands:
+            self.elementRuns[band] = tuple((static, tuple(elements))
+                for static, elements in groupby(band.elements, _isStatic))
+            imageFields = tuple(element for b in Band._bands(band)
+                for element in b.elements if isinstance(element, ImageField))
+            if imageFields:
+                self.imageFields[band] = imageFields
+            placedTexts = tuple(element for element in band.elements
+                if isinstance(element, TextElement)
+                and not _usesPageCount(element))
+            if placedTexts:
+                self.placedTexts[band] = placedTexts
+            if isinstance(band, DetailBand):
+                if band.columnHeader is not None:
+                    self.columnHeaders[band] = band.columnHeader
+                if band.columnFooter is not None:
+                    self.columnFooters[band] = band.columnFooter
+                self.subdetails[band] = tuple(
+                    (subdetail, isinstance(subdetail, DetailBand))
+                    for subdetail in band.subdetails)
+                pageAggregates += band.pageAggregates
+                groups += band.groups
+        self.pageAggregates = tuple(pageAggregates)
+        self.groups = tuple(groups)
+        self.sectionBands = {section: tuple(
+            (band, isinstance(band, DetailBand))
+            for band in section.detailBands) for section in report.sections}
+        self.dataItemBands = frozenset(band for band in bands
+            if any(self._paintsData(b) for b in Band._bands(band)))
+
+    def _paintsData(self, band):
+        """ True if painting a laid out band needs its data item """
+        if (band.on_after_print is not None
+                or type(band).render is not Band.render):
+            return True
+        placedTexts = self.placedTexts.get(band, ())
+        return any(element not in placedTexts and not _isStatic(element)
+            and not isinstance(element, PageNumber)
+            for element in band.elements)
+
+
+def _isStatic(element):
+    isStatic = getattr(element, '_isStatic', None)
+    return isStatic is not None and isStatic()
+
+
+def _usesPageCount(element):
+    usesPageCount = getattr(element, '_usesPageCount', None)
+    if usesPageCount is not None:
+        return usesPageCount()
+    return getattr(element, 'usesPageCount', False)
+
+
+# Render context in use by each thread, for reading group and aggregate
+# values from event handlers, see DetailGroup.value and Aggregate.value
+_contexts = threading.local()
+
+
+def _currentContext():
+    return getattr(_contexts, 'context', None)
+
+
+def _painterContext(painter):
+    """
+        Returns the RenderContext for elements painting with painter: its
+        own, the current one of the thread if it has none, or a new one, so
+        elements can be painted with a plain QPainter too.
+    """
+    context = getattr(painter, 'context', None)
+    if context is None:
+        context = _currentContext()
+        if context is None:
+            context = RenderContext(None)
+    return context
+
+
+# Texts of LayoutItem not having any, shared
+_noTexts = {}
+
+
+def _placedTexts(painter):
+    """ Returns the texts of the LayoutItem painted, see LayoutItem """
+    context = getattr(painter, 'context', None)
+    if context is None:
+        context = _currentContext()
+    if context is None or context.placed is None:
+        return _noTexts
+    return context.placed.texts
 
-    def getDataItem(self):
-        return self._item
 
-    def getPrevDataItem(self):
-        return self._prev
+class RenderContext(object):
+    """
+        State of a render in progress, kept apart from the report, its
+        bands and elements, so the same report can be rendered by several
+        threads at once. Elements reach it through the painter.
+
+        Properties
+        ----------
+        * renderer: the ReportRenderer rendering, None for elements painted
+            outside of a render.
+        * page: int, the page being rendered, 1 outside of a render. Read
+            only.
+        * pageCount: int, the page count of the report. While laying it out,
+            it isn't known yet, so it's the current page, a fair approximation
+            for measuring. Read only.
+        * groupValues: dict, value of the current group of each DetailGroup.
+        * lastTexts: dict, last text painted by each noRepeat element.
+        * renderBands: dict, whether each band is rendered this time, see
+            Band.renderBand.
+        * functionValues: dict, (data item id, value) last computed by each
+            Function element.
+        * placed: LayoutItem being painted when painting a layout, else
+            None.
+
+        Used as a context manager, it's made the current context of the
+        thread while rendering.
+    """
 
-    def nextDataItem(self):
-        self._prev = self._item
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.groupValues = {}
+        self.lastTexts = {}
+        self.renderBands = {}
+        self.functionValues = {}
+        self.placed = None
+        self._aggregates = {}
+        self._previous = []
+
+    @property
+    def page(self):
+        if self.renderer is None:
+            return 1
+        return self.renderer.page
+
+    @property
+    def pageCount(self):
+        if self.renderer is None:
+            return 1
+        return self.renderer.pageCount or self.renderer.page
+
+    def aggregate(self, aggregate):
+        """
+            Returns the Aggregate computed by this render for an aggregate
+            of the report, a copy of it.
+        """
         try:
-            self._item = next(self._iterator)
-        except StopIteration:
-            self._item = None
-            raise DataSourceExausted()
-        return self._item
+            return self._aggregates[aggregate]
+        except KeyError:
+            state = self._aggregates[aggregate] = copy.copy(aggregate)
+            state.reset()
+            return state
 
+    def __enter__(self):
+        self._previous.append(_currentContext())
+        _contexts.context = self
+        return self
 
-class LastPageReached(Exception):
-    """ Exception class used to finish rendering if last page selected is reached """
-    pass
+    def __exit__(self, *exc_info):
+        _contexts.context = self._previous.pop()
+
+
+class ReportPainter(QPainter):
+    """
+        The QPainter used for rendering reports, giving elements access
+        to the render in progress.
+
+        Properties
+        ----------
+        * renderer: the ReportRenderer using the painter.
+        * context: RenderContext of the render.
+        * bandHeights: dict, last height measured for each expanding band,
+            as a (data item, height) tuple.
+        * textMetrics: TextMetricsCache shared by all the text elements.
+        * textDocuments: TextDocumentCache shared by all the rich text
+            elements.
+        * staticTexts: StaticTextCache shared by all the plain text
+            elements.
+        * pictures: PictureCache of the static elements of bands.
+        * borderLines: list of (pen, QLineF) border lines, drawn at once
+            when the band being rendered ends, or None.
+        * images: ImageDecoder for the ImageField elements.
+        * plan: RenderPlan of the report being rendered, or None.
+
+        Fonts, pens and brushes are set only when they differ from the
+        current ones, so elements can set them freely.
+    """
+
+    def __init__(self, renderer):
+        super(ReportPainter, self).__init__()
+        self.renderer = renderer
+        self.context = renderer.context
+        self.bandHeights = {}
+        self.textMetrics = renderer.textMetrics
+        self.textDocuments = TextDocumentCache()
+        self.staticTexts = StaticTextCache()
+        self.pictures = PictureCache()
+        self.borderLines = None
+        self.images = ImageDecoder()
+        self.plan = None
+        self._font = self._pen = self._brush = None
+
+    def _trackState(self):
+        self._font = QPainter.font(self)
+        self._pen = QPainter.pen(self)
+        self._brush = QPainter.brush(self)
+
+    def begin(self, device):
+        result = super(ReportPainter, self).begin(device)
+        self._trackState()
+        return result
+
+    def end(self):
+        self.images.close()
+        return super(ReportPainter, self).end()
+
+    def restore(self):
+        super(ReportPainter, self).restore()
+        self._trackState()
+
+    def setFont(self, font):
+        if font != self._font:
+            super(ReportPainter, self).setFont(font)
+            self._font = QPainter.font(self)
+
+    def setPen(self, pen):
+        if not isinstance(pen, QPen):
+            pen = QPen(pen)
+        if pen != self._pen:
+            super(ReportPainter, self).setPen(pen)
+            self._pen = pen
+
+    def setBrush(self, brush):
+        if not isinstance(brush, QBrush):
+            brush = QBrush(brush)
+        if brush != self._brush:
+            super(ReportPainter, self).setBrush(brush)
+            self._brush = brush
+
+    def drawBorderLines(self):
+        """ Draws the border lines kept so far """
+        lines = self.borderLines
+        self.borderLines = None
+        _drawLines(self, lines)
 
 
 class ReportRenderer(object):
 
-    def __init__(self, report):
+    def __init__(self, report, plan=None):
         self._report = report
+        self._plan = plan
         self.page = 1
+        self.pageCount = None
+        self.textMetrics = report.textMetrics or TextMetricsCache()
+        self.context = RenderContext(self)
 
-    def _printerSetup(self):
+    def _printerSetup(self, printer):
         global _dpi
         rpt = self._report
-        self.__printer.setDocName(rpt.title)
-        self.__printer.setResolution(_dpi)
-        self.__printer.setPaperSize(rpt.paperSize)
-        self.__printer.setOrientation(rpt.paperOrientation)
-        self.__printer.setPageMargins(
+        printer.setDocName(rpt.title)
+        printer.setResolution(_dpi)
+        printer.setPaperSize(rpt.paperSize)
+        printer.setOrientation(rpt.paperOrientation)
+        printer.setPageMargins(
             rpt.margins[3], rpt.margins[0],
             rpt.margins[1], rpt.margins[2],
             QPrinter.DevicePixel)
 
+    def _skipPage(self):
+        """ True if the current page is before the first page to print """
+        return self.__firstPage and self.page < self.__firstPage
+
+    def _pageBreak(self):
+        if not self._skipPage():
+            self.__printer.newPage()
+
+    def _beginPage(self):
+        self._report.renderBorderAndBackground(self.__painter,
+            self.__pageRect)
+
+    def _placeBand(self, band, rect, dataItem):
+        if not self._skipPage():
+            band.render(self.__painter, rect, dataItem)
+
     def _newPage(self, dataItem):
         if (self._report.footer
                 and self.__y < self.__pageHeight - self.__footerHeight):
@@ -283,14 +1140,13 @@ class ReportRenderer(object):
 
         if self.__lastPage and self.page == self.__lastPage:
             raise LastPageReached()
-        if not (self.__firstPage and self.page < self.__firstPage):
-            self.__printer.newPage()
+        self._pageBreak()
         self.page += 1
         self.__y = 0.0
+        for aggregate in self._pageAggregates:
+            aggregate.reset()
 
-        rect = self.__printer.pageRect()
-        rect.moveTo(0.0, 0.0)
-        self._report.renderBorderAndBackground(self.__painter, rect)
+        self._beginPage()
         self._printPageHeader(dataItem)
 
     def _renderBandPageWide(self, band, dataItem, checkEnd=True):
@@ -299,57 +1155,49 @@ class ReportRenderer(object):
 
         # Band own's dataset overrides provided by the caller
         # for detail bands it gets the same items as provided by the renderer!
-        try:
-            ds = self._dataSources[band.dataSet]
+        ds = self._bandSources.get(band)
+        if ds is not None:
             dataItem = ds.getDataItem()
-        except KeyError:
-            pass
-        height = band.renderHeight(self.__painter, dataItem)
+        height = self._bandHeight(band, dataItem)
         if checkEnd and self.__y + height > self.__detailBottom:
             self._newPage(dataItem)
 
         if band.preRender(dataItem):
             # band.RenderBand == True
-            if not(self.__firstPage and self.page < self.__firstPage):
-                rect = QRectF(0.0, self.__y, self.__pageWidth, height)
-                band.render(self.__painter, rect, dataItem)
+            rect = QRectF(0.0, self.__y, self.__pageWidth, height)
+            self._placeBand(band, rect, dataItem)
             self.__y += height
 
         if band.forceNewPageAfter:
             self._newPage(dataItem)
 
     def _renderBandColumnWide(self, band, dataItem, checkEnd=True):
-        try:
-            ds = self._dataSources[band.dataSet]
+        ds = self._bandSources.get(band)
+        if ds is not None:
             dataItem = ds.getDataItem()
-        except KeyError:
-            pass
 
         if band.forceNewPage:
             self._newPage(dataItem)
-        else:
-            # FIXME: Only works if band's dataSet attribute is defined
-            try:
-                if band.startNewPage and ds.getPrevDataItem():
-                    self._newPage(dataItem)
-            except UnboundLocalError:  # Ignore if no datasource
-                print('UnboundLocalError')
-                pass
+        # FIXME: Only works if band's dataSet attribute is defined
+        elif band.startNewPage and ds is not None and ds.getPrevDataItem():
+            self._newPage(dataItem)
 
-        height = band.renderHeight(self.__painter, dataItem)
+        height = self._bandHeight(band, dataItem)
         if checkEnd and self.__y + height > self.__detailBottom:
             self._continueInNewColumn(dataItem)
 
         if band.preRender(dataItem):
             # band.RenderBand == True
-            if not(self.__firstPage and self.page < self.__firstPage):
-                rect = QRectF(self.__x, self.__y, self.__columnWidth, height)
-                band.render(self.__painter, rect, dataItem)
+            rect = QRectF(self.__x, self.__y, self.__columnWidth, height)
+            self._placeBand(band, rect, dataItem)
             self.__y += height
 
         if band.forceNewPageAfter:
             self._newPage(dataItem)
 
+    def _bandHeight(self, band, dataItem=None):
+        return band.renderHeight(self.__painter, dataItem)
+
     def _printPageHeader(self, dataItem):
         if self._report.header is not None:
             self._renderBandPageWide(self._report.header, dataItem, False)
@@ -368,38 +1216,29 @@ class ReportRenderer(object):
             self._renderBandPageWide(self._report.summary, dataItem, True)
 
     def _printColumnHeader(self, detailBand, dataItem):
-        try:
-            if detailBand.columnHeader is not None:
-
-                # Check for new column here, if done in _renderBandColumnWide
-                # the header will print twice
-                try:
-                    ds = self._dataSources[detailBand.columnHeader.dataSet]
-                    dataItem = ds.getDataItem()
-                except KeyError:
-                    pass
-
-                height = detailBand.columnHeader.renderHeight(self.__painter,
-                    dataItem)
-                if self.__y + height > self.__detailBottom:
-                    # recursively calls _printColumnHeader and do the
-                    # actual band rendering falling by the else clause
-                    self._continueInNewColumn(dataItem)
-                else:
-                    # Not at the end, render normally
-                    self._renderBandColumnWide(detailBand.columnHeader,
-                        dataItem, False)
-        except AttributeError:  # detailBand is a regular band
-            pass
+        columnHeader = self._plan.columnHeaders.get(detailBand)
+        if columnHeader is not None:
+
+            # Check for new column here, if done in _renderBandColumnWide
+            # the header will print twice
+            ds = self._bandSources.get(columnHeader)
+            if ds is not None:
+                dataItem = ds.getDataItem()
+
+            height = self._bandHeight(columnHeader, dataItem)
+            if self.__y + height > self.__detailBottom:
+                # recursively calls _printColumnHeader and do the
+                # actual band rendering falling by the else clause
+                self._continueInNewColumn(dataItem)
+            else:
+                # Not at the end, render normally
+                self._renderBandColumnWide(columnHeader, dataItem, False)
 
     def _printColumnFooter(self, detailBand, dataItem):
-        try:
-            if detailBand.columnFooter is not None:
-                self.__y = self.__detailBottom
-                self._renderBandColumnWide(detailBand.columnFooter, dataItem,
-                    False)
-        except AttributeError:  # detailBand is a regular band
-            pass
+        columnFooter = self._plan.columnFooters.get(detailBand)
+        if columnFooter is not None:
+            self.__y = self.__detailBottom
+            self._renderBandColumnWide(columnFooter, dataItem, False)
 
     def _printDetailBegin(self, detailBand, dataItem):
         if detailBand.begin:
@@ -429,59 +1268,87 @@ class ReportRenderer(object):
             The dataset attribute is provided for subdetails.
         """
         self._currentDetailBand = detailBand
-        try:
-            detailFooterHeight = detailBand.columnFooter.renderHeight(
-                self.__painter)
-        except AttributeError:
+        columnFooter = self._plan.columnFooters.get(detailBand)
+        if columnFooter is not None:
+            detailFooterHeight = self._bandHeight(columnFooter)
+        else:
             detailFooterHeight = 0
         self.__detailBottom = self.__pageHeight - (self.__footerHeight +
                 detailFooterHeight)
 
         if dataSet is not None:
-            ds = DataSource(dataSet)
+            ds = dataSource(dataSet)
+            if detailBand.orderBy:
+                ds = self._orderedDataSource(detailBand, ds)
         elif detailBand.dataSet is not None:
             ds = self._dataSources[detailBand.dataSet]
         else:
             ds = self._dataSources[self._report.dataSet]
 
+        groupBreaks = self._groupBreaks(detailBand, ds)
+        lookahead = self._groupLookahead(detailBand, ds)
+        imageFields = self._plan.imageFields.get(detailBand, ())
+        readAhead = max([field.readAhead for field in imageFields] or [0])
+        prefetched = -1  # Position of the last data item prefetched
+        context = self.context
+        groupValues = context.groupValues
+        for aggregate in detailBand.aggregates:
+            context.aggregate(aggregate).reset()
+        # Every data item updates the detail, page and open groups aggregates
+        aggregates = detailBand.aggregates + detailBand.pageAggregates
+        if lookahead is None:
+            for group in detailBand.groups:
+                aggregates += group.aggregates
+        aggregates = [context.aggregate(aggregate) for aggregate in aggregates]
+
         try:
             groupingLevel = 0
             dataItem = ds.getDataItem()
-            if not dataItem and not detailBand.renderIfEmpty:
+            # Data items can be falsy, like empty records
+            if dataItem is None and not detailBand.renderIfEmpty:
                 return
             self._printDetailBegin(detailBand, dataItem)
             self._printColumnHeader(detailBand, dataItem)
 
-            if dataItem:
+            if dataItem is not None:
                 # Print first round of group headers
                 for group in detailBand.groups:
                     groupingLevel += 1
-                    group.value = group.expression(dataItem)
+                    groupValues[group] = group.expression(dataItem)
+                    self._startGroupAggregates(detailBand, groupingLevel,
+                        lookahead)
                     if group.header:
                         self._renderBandColumnWide(group.header, dataItem, True)
+                new_group_values = None
 
                 while True:
 
                     # Print headers
                     # TODO: Can I use this to print the first round?
                     for group in detailBand.groups[groupingLevel:]:
+                        groupValues[group] = new_group_values[groupingLevel]
                         groupingLevel += 1
-                        group.value = group.expression(dataItem)
+                        self._startGroupAggregates(detailBand,
+                            groupingLevel, lookahead)
                         if group.header:
                             self._renderBandColumnWide(group.header, dataItem,
                                 True)
 
+                    if imageFields:
+                        # Just the data items not prefetched yet
+                        dataItems = [dataItem] + ds.peek(readAhead)
+                        start = max(0, prefetched - ds.position + 1)
+                        self._prefetchImages(imageFields, dataItems[start:])
+                        prefetched = ds.position + len(dataItems) - 1
                     self._renderBandColumnWide(detailBand, dataItem, True)
-
-                    for subdetail in detailBand.subdetails:
-                        if isinstance(subdetail, DetailBand):
-                            dsPath = subdetail.dataSet.split('.')
-                            part = dsPath.pop(0)
-                            sub_ds = getattr(dataItem, part)
-                            while dsPath:
-                                part = dsPath.pop(0)
-                                sub_ds = getattr(sub_ds, part)
-
+                    for aggregate in aggregates:
+                        aggregate.update(dataItem)
+
+                    for subdetail, isDetailBand in self._plan.subdetails[
+                            detailBand]:
+                        if isDetailBand:
+                            sub_ds = self._subdetailDataSet(subdetail, ds,
+                                dataItem)
                             self._renderDetailBand(subdetail, sub_ds)
                         else:
                             self._currentDetailBand = subdetail
@@ -496,16 +1363,23 @@ class ReportRenderer(object):
                     # Checking must start from the outermost group
                     # The most outermost group changing triggers closing
                     # of that group and any inner group
-                    new_group_values = [group.expression(dataItem)
-                                        for group in detailBand.groups]
-
-                    # If never set to a lower value in the for loop, use
-                    # this value to avoid unrolling any group
-                    groupUnrollLevel = len(detailBand.groups) - 1
-                    for i, group in enumerate(detailBand.groups):
-                        if new_group_values[i] != group.value:
-                            groupUnrollLevel = i - 1
-                            break
+                    if groupBreaks is not None:
+                        # Only the groups closing need their new values
+                        groupUnrollLevel = groupBreaks[ds.position] - 1
+                        new_group_values = [None] * (groupUnrollLevel + 1) + [
+                            group.expression(dataItem) for group in
+                            detailBand.groups[groupUnrollLevel + 1:]]
+                    else:
+                        new_group_values = [group.expression(dataItem)
+                                            for group in detailBand.groups]
+
+                        # If never set to a lower value in the for loop, use
+                        # this value to avoid unrolling any group
+                        groupUnrollLevel = len(detailBand.groups) - 1
+                        for i, group in enumerate(detailBand.groups):
+                            if new_group_values[i] != groupValues[group]:
+                                groupUnrollLevel = i - 1
+                                break
                     # Can't use -1 index to include index 0 when step is -1
                     # because negative indexes have it's own semantics.
                     # So setting to None is required
@@ -514,7 +1388,7 @@ class ReportRenderer(object):
 
                     for group in detailBand.groups[:groupUnrollLevel:-1]:
                         groupingLevel -= 1
-                        group.value = new_group_values[groupingLevel]
+                        groupValues[group] = new_group_values[groupingLevel]
                         if group.footer:
                             self._renderBandColumnWide(group.footer,
                                 ds.getPrevDataItem(), True)
@@ -527,21 +1401,198 @@ class ReportRenderer(object):
         if ds.getPrevDataItem():
             for group in detailBand.groups[::-1]:
                 groupingLevel -= 1
-                # group.value = new_group_value
+                # groupValues[group] = new_group_value
                 if group.footer:
                     self._renderBandColumnWide(group.footer,
                         ds.getPrevDataItem(), True)
 
         self._printDetailSummary(detailBand, ds.getPrevDataItem())
 
+    def _prefetchImages(self, imageFields, dataItems):
+        """ Starts decoding the images of the data items to paint next """
+        images = self.__painter.images
+        for dataItem in dataItems:
+            for field in imageFields:
+                source = field._source(dataItem)
+                if source is not None:
+                    images.prefetch(source, field.width, field.height)
+
+    def _orderedDataSource(self, detailBand, ds):
+        """
+            Returns a new data source with the items of ds sorted as
+            detailBand.orderBy asks, see DetailBand.
+        """
+        orderBy = detailBand.orderBy
+        if not callable(orderBy):
+            names = self._groupColumns(detailBand, ds)
+            if names is not None and hasattr(ds, 'sortedBy'):
+                return ds.sortedBy(names)
+            groups = detailBand.groups
+
+            def orderBy(item):
+                return tuple(group.expression(item) for group in groups)
+
+        def remaining():
+            if ds.position < 0:
+                return
+            yield ds.getDataItem()
+            while True:
+                try:
+                    yield ds.nextDataItem()
+                except DataSourceExausted:
+                    return
+        try:
+            items = sortedItems(remaining(), orderBy,
+                detailBand.sortBufferSize)
+        finally:
+            ds.close()
+        return DataSource(items)
+
+    def _subdetailDataSet(self, subdetail, ds, dataItem):
+        """
+            Returns the dataset of a subdetail for a data item of the parent
+            data source. Using a batch loader, it's taken from the children
+            loaded at once for a window of parent items, see DetailBand.
+        """
+        if subdetail.batchLoader is None:
+            return _accessor(subdetail.dataSet)(dataItem)
+
+        batchKey = subdetail.batchKey
+        if not callable(batchKey):
+            batchKey = _accessor(batchKey)
+        key = batchKey(dataItem)
+        # Keys requested for the window along with the children loaded,
+        # as items having no children are missing from them
+        keys, batch = self._batches.get(subdetail, ((), None))
+        if key not in keys:
+            items = [dataItem] + ds.peek(subdetail.batchSize - 1)
+            parentKeys = [batchKey(item) for item in items]
+            batch = subdetail.batchLoader(parentKeys)
+            keys = set(parentKeys)
+            self._batches[subdetail] = (keys, batch)
+        return batch.get(key, ())
+
+    def _startGroupAggregates(self, detailBand, groupingLevel, lookahead):
+        """
+            Resets the aggregates of the group starting, or sets them to the
+            group totals when computed beforehand.
+        """
+        context = self.context
+        group = detailBand.groups[groupingLevel - 1]
+        if lookahead is None:
+            for aggregate in group.aggregates:
+                context.aggregate(aggregate).reset()
+        else:
+            path = tuple(context.groupValues[g]
+                for g in detailBand.groups[:groupingLevel])
+            for aggregate, state in zip(group.aggregates, lookahead[path]):
+                context.aggregate(aggregate)._restore(state)
+
+    def _groupLookahead(self, detailBand, ds):
+        """
+            Computes the group aggregates of the whole dataset beforehand,
+            if the detail band asks for it, see DetailBand.lookahead.
+            Returns a dict of aggregate states, keyed by group path, i.e. the
+            tuple of the group values from the outermost group.
+        """
+        if (not detailBand.lookahead or
+                not any(group.aggregates for group in detailBand.groups)):
+            return None
+        lookahead = self._columnarLookahead(detailBand, ds)
+        if lookahead is not None:
+            return lookahead
+
+        groups = detailBand.groups
+        lookahead = {}
+        # (path, aggregates) of the current group of each level
+        current = [(None, None)] * len(groups)
+        for item in ds.reiterate():
+            values = [group.expression(item) for group in groups]
+            for level, group in enumerate(groups):
+                path = tuple(values[:level + 1])
+                currentPath, aggregates = current[level]
+                if aggregates is None or path != currentPath:
+                    if aggregates is not None:
+                        lookahead[currentPath] = [aggregate._save()
+                            for aggregate in aggregates]
+                    aggregates = [copy.copy(aggregate)
+                        for aggregate in group.aggregates]
+                    for aggregate in aggregates:
+                        aggregate.reset()
+                    current[level] = (path, aggregates)
+                for aggregate in aggregates:
+                    aggregate.update(item)
+        for path, aggregates in current:
+            if aggregates is not None:
+                lookahead[path] = [aggregate._save()
+                    for aggregate in aggregates]
+        return lookahead
+
+    def _columnarLookahead(self, detailBand, ds):
+        """
+            Computes the group aggregates from the columns at once, when all
+            the groups and aggregates are defined by column names.
+        """
+        names = self._groupColumns(detailBand, ds)
+        if names is None or not hasattr(ds, 'groupSegments'):
+            return None
+        for group in detailBand.groups:
+            for aggregate in group.aggregates:
+                if aggregate.expression is None:
+                    continue  # Just counting
+                if (aggregate.attrName not in ds.columns or
+                        aggregate.expression is not
+                        _accessor(aggregate.attrName)):
+                    return None
+
+        lookahead = {}
+        segments = ds.groupSegments(names)
+        for level, group in enumerate(detailBand.groups):
+            starts = segments[level]
+            keys = [ds.columns[name] for name in names[:level + 1]]
+            for start, end in zip(starts, starts[1:] + [ds.length]):
+                path = tuple(key[start] for key in keys)
+                lookahead[path] = [aggregate._reduce(
+                    ds.columns[aggregate.attrName][start:end]
+                    if aggregate.expression is not None
+                    else range(start, end))
+                    for aggregate in group.aggregates]
+        return lookahead
+
+    def _groupColumns(self, detailBand, ds):
+        """
+            Returns the column names defining the groups of the detail band,
+            or None if any group isn't defined by a column name.
+        """
+        if not detailBand.groups or not hasattr(ds, 'columns'):
+            return None
+        names = []
+        for group in detailBand.groups:
+            if (group.attrName not in ds.columns
+                    or group.expression is not _accessor(group.attrName)):
+                return None
+            names.append(group.attrName)
+        return names
+
+    def _groupBreaks(self, detailBand, ds):
+        """
+            Returns the group break index of the data source, computed at
+            once, if possible: that is, for a columnar data source, when
+            every group is defined by a column name, see DetailGroup.attrName.
+        """
+        names = self._groupColumns(detailBand, ds)
+        if names is None:
+            return None
+        return ds.groupBreaks(names)
+
     def _renderSection(self, section):
         self._currentSection = section
         # TODO: Setup section here
         self.__columnWidth = (self.__pageWidth - section.columnSpace *
             (section.columns - 1)) / section.columns
 
-        for band in section.detailBands:
-            if isinstance(band, DetailBand):
+        for band, isDetailBand in self._plan.sectionBands[section]:
+            if isDetailBand:
                 self._renderDetailBand(band)
             else:
                 try:
@@ -554,37 +1605,63 @@ class ReportRenderer(object):
                 self._renderBandColumnWide(band, dataItem, True)
 
     def render(self, printer, dataSources):
-        rpt = self._report
-
         # 3
         self.__printer = printer
-        self.__firstPage = printer.fromPage()
-        self.__lastPage = printer.toPage()
-        self._printerSetup()
-        self.__painter = QPainter()
-        self.__painter.begin(printer)
+        self._printerSetup(printer)
+        painter = ReportPainter(self)
+        painter.begin(printer)
+        try:
+            with self.context:
+                self._run(painter, printer.pageRect(), dataSources,
+                    printer.fromPage(), printer.toPage())
+        finally:
+            painter.end()
+
+    def _run(self, painter, pageRect, dataSources, firstPage=0, lastPage=0):
+        rpt = self._report
+        self.__painter = painter
+        self.__firstPage = firstPage
+        self.__lastPage = lastPage
 
         # 4
         rpt.renderSetup(self.__painter)
-        rect = printer.pageRect()
-        rect.moveTo(0.0, 0.0)
+        self.__pageRect = QRectF(0.0, 0.0, pageRect.width(),
+            pageRect.height())
 
         if rpt.on_before_print is not None:
             rpt.on_before_print()
 
+        self._dataSources = {k: dataSource(ds)
+            for k, ds in dataSources.items()}
+        for section in rpt.sections:
+            for band in section.detailBands:
+                name = getattr(band, 'dataSet', None) or rpt.dataSet
+                ds = self._dataSources.get(name)
+                if ds is not None and getattr(band, 'orderBy', None):
+                    self._dataSources[name] = self._orderedDataSource(band,
+                        ds)
+        if self._plan is None:
+            self._plan = rpt._plan()
+        painter.plan = plan = self._plan
+        # Data sources of the bands having their own
+        self._bandSources = {band: self._dataSources[name]
+            for band, name in plan.dataSets.items()
+            if name in self._dataSources}
+        self._batches = {}
+        self._pageAggregates = [self.context.aggregate(aggregate)
+            for aggregate in plan.pageAggregates]
+
         # 5
-        rpt.renderBorderAndBackground(self.__painter, rect)
         self.page = 1
+        self._beginPage()
 
         self.__y = 0.0
         self.__col = 0
         self.__x = 0
 
-        self.__pageHeight = printer.pageRect().height()
-        self.__pageWidth = printer.pageRect().width()
+        self.__pageHeight = self.__pageRect.height()
+        self.__pageWidth = self.__pageRect.width()
 
-        self._dataSources = {k: DataSource(ds)
-            for k, ds in dataSources.items()}
         try:
             ds = self._dataSources[rpt.dataSet]
             dataItem = ds.getDataItem()
@@ -601,7 +1678,7 @@ class ReportRenderer(object):
             # If I don't, I'll be never sure when I must print the footer
             # just by looking at a single detail item
             if rpt.footer is not None:
-                self.__footerHeight = rpt.footer.renderHeight(self.__painter)
+                self.__footerHeight = self._bandHeight(rpt.footer)
             else:
                 self.__footerHeight = 0
 
@@ -613,8 +1690,262 @@ class ReportRenderer(object):
                 self._printPageFooter(dataItem)
         except LastPageReached:
             # Just end printing when last page
-            pass 
-        self.__painter.end()
+            pass
+        finally:
+            for ds in self._dataSources.values():
+                ds.close()
+
+
+# Painting happens later than placing the band, so the state it needs is
+# kept: values holds the aggregates shown by the band along with their
+# values, groupValues the value of every DetailGroup, texts the text of each
+# text element of the band and its children, but for those printing the
+# page count, and children the child bands rendered. Texts and children
+# are found when placing the band, as rendering would, so events changing
+# them fire at the same time.
+LayoutItem = namedtuple('LayoutItem',
+    'band rect dataItem values groupValues texts children')
+
+
+class LayoutPage(object):
+    """
+        A page of a ReportLayout.
+
+        Properties
+        ----------
+        * number: int, page number, starting at 1.
+        * items: list of LayoutItem (band, rect, dataItem, values,
+            groupValues, texts, children), in painting order.
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.items = []
+
+
+class ReportLayout(object):
+    """
+        The result of the layout pass of a report: a display list per page,
+        that can be painted several times, or just partially, without
+        measuring the report again.
+
+        Properties
+        ----------
+        * pageRect: QRectF, the printable area of the pages.
+        * pages: list of LayoutPage.
+    """
+
+    def __init__(self, pageRect):
+        self.pageRect = pageRect
+        self.pages = []
+
+    @property
+    def pageCount(self):
+        return len(self.pages)
+
+    def placements(self, band=None):
+        """
+            Yields (page number, LayoutItem) tuples for every band placed,
+            or just for the given band if any, in report order.
+
+            i.e. the page where each group starts can be found by asking
+            for the placements of the group header band.
+        """
+        for page in self.pages:
+            for item in page.items:
+                if band is None or item.band is band:
+                    yield page.number, item
+
+
+class LayoutRenderer(ReportRenderer):
+    """
+        Renderer doing the layout pass only: bands are measured and placed
+        as when rendering, but instead of being painted they are recorded
+        into a ReportLayout.
+
+        The data item of each band is kept only if painting needs it when
+        keepDataItems is False, like for a layout painted right away.
+    """
+
+    def __init__(self, report, plan=None, keepDataItems=True):
+        super(LayoutRenderer, self).__init__(report, plan)
+        self.keepDataItems = keepDataItems
+
+    def layout(self, dataSources, printer=None):
+        """
+            Lays out the report, returning a ReportLayout. If a printer is
+            given, its page geometry is used, but nothing is painted on it.
+        """
+        global _dpi
+        if printer is None:
+            printer = QPrinter()
+            printer.setOutputFormat(QPrinter.PdfFormat)
+        self._printerSetup(printer)
+        pageRect = printer.pageRect()
+        self._layout = ReportLayout(QRectF(0.0, 0.0, pageRect.width(),
+            pageRect.height()))
+
+        # Measuring still requires a painter, but a cheap device will do
+        device = QImage(1, 1, QImage.Format_ARGB32)
+        device.setDotsPerMeterX(int(_dpi / 0.0254))
+        device.setDotsPerMeterY(int(_dpi / 0.0254))
+        painter = ReportPainter(self)
+        painter.begin(device)
+        try:
+            with self.context:
+                self._run(painter, pageRect, dataSources)
+        finally:
+            painter.end()
+        return self._layout
+
+    def _run(self, painter, pageRect, dataSources, firstPage=0, lastPage=0):
+        self._painter = painter
+        self._groupValues = ()
+        self._aggregatesShown = {}
+        super(LayoutRenderer, self)._run(painter, pageRect, dataSources,
+            firstPage, lastPage)
+
+    def _pageBreak(self):
+        pass
+
+    def _prefetchImages(self, imageFields, dataItems):
+        pass  # Nothing is painted
+
+    def _beginPage(self):
+        self._layout.pages.append(LayoutPage(self.page))
+
+    def _placeBand(self, band, rect, dataItem):
+        context = self.context
+        values = tuple((aggregate, context.aggregate(aggregate)._save())
+            for aggregate in self._bandAggregates(band))
+        groupValues = tuple((group, context.groupValues.get(group))
+            for group in self._plan.groups)
+        # Shared by the items while the groups don't change
+        if groupValues == self._groupValues:
+            groupValues = self._groupValues
+        self._groupValues = groupValues
+        texts, children = self._placeTexts(band, dataItem)
+        if not self.keepDataItems and band not in self._plan.dataItemBands:
+            dataItem = None
+        self._layout.pages[-1].items.append(LayoutItem(band, rect, dataItem,
+            values, groupValues, texts, children))
+
+    def _placeTexts(self, band, dataItem):
+        """
+            Finds the texts of the band and of its children rendered, along
+            with those children, firing their events as rendering would.
+
+            Returns a (texts, children) tuple, see LayoutItem.
+        """
+        painter = self._painter
+        functionValues = self.context.functionValues
+        texts = {}
+        children = ()
+        while True:
+            for element in self._plan.placedTexts.get(band, ()):
+                if element.on_before_print is not None:
+                    element.on_before_print(element, dataItem)
+                texts[element] = element._renderText(painter, dataItem)
+                # As rendering does, see Function.render()
+                functionValues.pop(element, None)
+            band = band.child
+            if band is None or not band.preRender(dataItem):
+                break
+            children += (band,)
+        return texts or _noTexts, children
+
+    def _bandAggregates(self, band):
+        try:
+            return self._aggregatesShown[band]
+        except KeyError:
+            pass
+        aggregates = []
+        b = band
+        while b is not None:
+            aggregates += [element.aggregate for element in b.elements
+                if getattr(element, 'aggregate', None) is not None]
+            b = b.child
+        self._aggregatesShown[band] = aggregates
+        return aggregates
+
+
+class LayoutPainter(ReportRenderer):
+    """
+        Renderer doing the paint pass only: replays a ReportLayout into a
+        printer, painting just the pages in the printer's page range.
+    """
+
+    def paint(self, printer, layout):
+        rpt = self._report
+        self._printerSetup(printer)
+        firstPage = printer.fromPage() or 1
+        lastPage = printer.toPage() or layout.pageCount
+        self.pageCount = layout.pageCount
+
+        painter = ReportPainter(self)
+        painter.begin(printer)
+        try:
+            rpt.renderSetup(painter)
+            if rpt.on_before_print is not None:
+                rpt.on_before_print()
+            if self._plan is None:
+                self._plan = rpt._plan()
+            painter.plan = plan = self._plan
+            with self.context as context:
+                if firstPage > 1:
+                    self._restore(painter, layout, firstPage)
+
+                pages = layout.pages[firstPage - 1:lastPage]
+                if pages:
+                    self._prefetchImages(painter, plan, pages[0])
+                for pageIndex, page in enumerate(pages):
+                    if pageIndex + 1 < len(pages):
+                        self._prefetchImages(painter, plan,
+                            pages[pageIndex + 1])
+                    if page.number > firstPage:
+                        printer.newPage()
+                    self.page = page.number
+                    rpt.renderBorderAndBackground(painter, layout.pageRect)
+                    for item in page.items:
+                        for aggregate, value in item.values:
+                            context.aggregate(aggregate)._restore(value)
+                        context.groupValues.update(item.groupValues)
+                        context.placed = item
+                        item.band.render(painter, item.rect, item.dataItem)
+                    context.placed = None
+        finally:
+            painter.end()
+
+    def _prefetchImages(self, painter, plan, page):
+        """ Starts decoding the images of a page """
+        for item in page.items:
+            for element in plan.imageFields.get(item.band, ()):
+                source = element._source(item.dataItem)
+                if source is not None:
+                    painter.images.prefetch(source, element.width,
+                        element.height)
+
+    def _restore(self, painter, layout, pageNumber):
+        """
+            Restores the state a full render would have when starting to
+            paint the page, so it can be painted alone. Every LayoutItem
+            keeps the state it's painted with, but noRepeat elements need
+            the last text painted in the previous page.
+        """
+        context = self.context
+        prevPage = layout.pages[pageNumber - 2]
+        self.page = prevPage.number
+        for item in prevPage.items:
+            for aggregate, value in item.values:
+                context.aggregate(aggregate)._restore(value)
+            context.groupValues.update(item.groupValues)
+            context.placed = item
+            for band in (item.band,) + item.children:
+                for element in band.elements:
+                    if getattr(element, 'noRepeat', False):
+                        context.lastTexts[element] = element._paintedText(
+                            painter, item.dataItem)
+        context.placed = None
 
 
 class Band(BaseElement):
@@ -640,6 +1971,10 @@ class Band(BaseElement):
             default False.
         expand: boolean, if False honors height attribute, if True expands
             height to accomodate elements if necessary
+        recordStatic: boolean, record static elements, like labels or lines
+            without events, once into a picture replayed each time the band
+            is rendered. Only for bands whose elements aren't changed by
+            events of the report, other bands or groups. Default False.
 
         Events
         ------
@@ -654,7 +1989,7 @@ class Band(BaseElement):
     startNewPage = False
     expand = False
     dataSet = None
-    renderBand = True
+    recordStatic = False
     on_after_print = None
 
     def __init__(self, **kw):
@@ -662,15 +1997,36 @@ class Band(BaseElement):
         if self.elements is None:
             self.elements = []
 
+    def _bands(self):
+        """ Yields the band itself and every band nested into it """
+        yield self
+        if self.child is not None:
+            for band in self.child._bands():
+                yield band
+
     def _bandRenderHeight(self, painter, data_item=None):
         height = self.height
         if self.expand:
+            # The band is measured before rendering it and again while
+            # rendering, so keep the last measure for the painter. Bands
+            # without a data item, like page headers, can't tell whether
+            # it's the same measure.
+            heights = getattr(painter, 'bandHeights', None)
+            if data_item is None:
+                heights = None
+            if heights is not None:
+                last = heights.get(self)
+                if last is not None and last[0] is data_item:
+                    return last[1]
             self.renderSetup(painter)  # Set font
             for element in self.elements:
                 elementBottom = element.top + element.renderHeight(painter,
                     data_item)
                 if elementBottom > height:
                     height = elementBottom
+            self.renderTearDown(painter)
+            if heights is not None:
+                heights[self] = (data_item, height)
         return height
 
     def renderHeight(self, painter, data_item=None):
@@ -679,6 +2035,25 @@ class Band(BaseElement):
             height += self.child.renderHeight(painter, data_item)
         return height
 
+    @property
+    def renderBand(self):
+        """
+            False when an event decides the band isn't rendered this time.
+            Kept by the render of the current thread, if any.
+        """
+        context = _currentContext()
+        if context is not None:
+            return context.renderBands.get(self, True)
+        return self.__dict__.get('renderBand', True)
+
+    @renderBand.setter
+    def renderBand(self, value):
+        context = _currentContext()
+        if context is not None:
+            context.renderBands[self] = value
+        else:
+            self.__dict__['renderBand'] = value
+
     def preRender(self, data_item):
         """
         Must be called by before each call to render()
@@ -705,17 +2080,50 @@ class Band(BaseElement):
                  rect.width(), self.height)
 
         self.renderSetup(painter)
+        # Borders of the band, its elements and children are drawn at once
+        batchBorders = (isinstance(painter, ReportPainter)
+            and painter.borderLines is None)
+        if batchBorders:
+            painter.borderLines = []
         self.renderBorderAndBackground(painter, band_rect)
 
-        for element in self.elements:
-            element.render(painter, band_rect, data_item)
+        pictures = getattr(painter, 'pictures', None)
+        if (pictures is None or not self.recordStatic
+                or self.on_before_print is not None):
+            for element in self.elements:
+                element.render(painter, band_rect, data_item)
+        else:
+            plan = getattr(painter, 'plan', None)
+            runs = plan.elementRuns.get(self) if plan is not None else None
+            if runs is None:
+                runs = [(static, tuple(elements))
+                    for static, elements in groupby(self.elements, _isStatic)]
+            # Runs of consecutive static elements are replayed, keeping
+            # the painting order
+            for static, elements in runs:
+                if static:
+                    pictures.draw(painter, self, elements, band_rect,
+                        data_item)
+                else:
+                    for element in elements:
+                        element.render(painter, band_rect, data_item)
 
         if self.child:
-            if self.child.preRender(data_item):
+            # When painting a layout, the child was rendered or not when
+            # placing the band
+            context = getattr(painter, 'context', None)
+            placed = context.placed if context is not None else None
+            if placed is not None:
+                renderChild = self.child in placed.children
+            else:
+                renderChild = self.child.preRender(data_item)
+            if renderChild:
                 child_rect = QRectF(rect.left(), rect.top() + self.height,
                     rect.width(), rect.height() - self.height)
                 self.child.render(painter, child_rect, data_item)
 
+        if batchBorders:
+            painter.drawBorderLines()
         self.renderTearDown(painter)
         if self.on_after_print is not None:
             self.on_after_print(self, data_item)
@@ -738,7 +2146,36 @@ class DetailBand(Band):
             default None.
         * begin: Band preceding the detail, default None.
         * summary: Band after the detail, default None.
-
+        * aggregates: List of Aggregate, computed over the whole detail,
+            so usable in the detail summary and the report summary.
+            Default empty list.
+        * pageAggregates: List of Aggregate, computed over the data items
+            printed in the current page, usable in the page footer.
+            Default empty list.
+        * lookahead: boolean, compute the group aggregates before rendering,
+            so group headers can print the group totals. Requires a dataset
+            that can be iterated twice, like a list or columnar data.
+            Default False.
+        * orderBy: Sorts the data items before rendering, either by the group
+            values when True, or by the key returned by a callable receiving
+            the data item. Default None, meaning the dataset is already
+            sorted as the groups require.
+        * sortBufferSize: int, maximum number of data items sorted in memory.
+            Larger datasets are sorted in runs of this size, kept in
+            temporary files, and merged while rendering. Default 100000.
+
+        Subdetails get their dataset from the parent data item, using their
+        dataSet property as an attribute path. When getting it means running
+        a query for each parent item, a batch loader can load the children
+        of several parent items at once instead:
+
+        * batchLoader: callable, receives a list of keys of parent data items
+            and returns a mapping of lists of children by parent key.
+            Default None.
+        * batchKey: The key of a parent data item, either an attribute path
+            or a callable receiving the parent data item. Default 'id'.
+        * batchSize: int, number of parent data items loaded at once,
+            default 100.
     """
     groups = None
     subdetails = None
@@ -748,6 +2185,14 @@ class DetailBand(Band):
     begin = None
     summary = None
     renderIfEmpty = False
+    batchLoader = None
+    batchKey = 'id'
+    batchSize = 100
+    aggregates = None
+    pageAggregates = None
+    lookahead = False
+    orderBy = None
+    sortBufferSize = 100000
 
     def __init__(self, **kw):
         super(DetailBand, self).__init__(**kw)
@@ -755,6 +2200,22 @@ class DetailBand(Band):
             self.groups = []
         if self.subdetails is None:
             self.subdetails =[]
+        if self.aggregates is None:
+            self.aggregates = []
+        if self.pageAggregates is None:
+            self.pageAggregates = []
+
+    def _bands(self):
+        for band in super(DetailBand, self)._bands():
+            yield band
+        related = [self.columnHeader, self.columnFooter, self.begin,
+            self.summary]
+        for group in self.groups:
+            related += [group.header, group.footer]
+        for band in related + self.subdetails:
+            if band is not None:
+                for b in band._bands():
+                    yield b
 
 
 class DetailGroup(object):
@@ -764,20 +2225,28 @@ class DetailGroup(object):
         Properties
         ----------
         * expression: callable, usually a lambda. Default None.
+        * attrName: str, data item attribute path to group by, as in Field,
+            used instead of an expression. Default None.
+            Grouping columnar data by column name allows finding every group
+            break at once, before rendering.
         * header: Group header band, useful for titles, default None.
         * footer: Group footer band, useful for summaries, default None.
+        * aggregates: List of Aggregate, computed over each group,
+            default empty list.
+        * value: value of the current group, while rendering. Read only.
 
         Events
         ------
         * on_new_group: callable (event handler), default None
     """
     expression = None
+    attrName = None
     header = None
     footer = None
     on_new_group = None
 
     def __init__(self, expression=None, header=None, footer=None,
-            on_new_group=None):
+            on_new_group=None, attrName=None, aggregates=None):
         if expression:
             self.expression = expression
         if header:
@@ -786,7 +2255,182 @@ class DetailGroup(object):
             self.footer = footer
         if on_new_group:
             self.on_new_group = on_new_group
-        self.value = None
+        if attrName:
+            self.attrName = attrName
+        if self.expression is None and self.attrName is not None:
+            self.expression = _accessor(self.attrName)
+        self.aggregates = list(aggregates or [])
+
+    @property
+    def value(self):
+        """ Value of the current group, in the render of this thread """
+        context = _currentContext()
+        return context.groupValues.get(self) if context is not None else None
+
+
+class Aggregate(object):
+    """
+        Base of aggregates, values computed incrementally over the data
+        items of a scope while rendering, see DetailGroup.aggregates,
+        DetailBand.aggregates and DetailBand.pageAggregates.
+        Use AggregateField elements for printing them.
+
+        Properties
+        ----------
+        * attrName: str, data item attribute path of the values to aggregate,
+            as in Field. Default None.
+        * expression: callable, receives the data item, returns the value to
+            aggregate, used instead of attrName. Default None.
+        * value: the aggregate value so far, while rendering. Read only.
+
+        Values being None are ignored.
+
+        Aggregates just define what to compute: every render computes its
+        own copy of them, see RenderContext.aggregate().
+    """
+    attrName = None
+    expression = None
+
+    def __init__(self, attrName=None, expression=None):
+        if attrName:
+            self.attrName = attrName
+        if expression:
+            self.expression = expression
+        if self.expression is None and self.attrName is not None:
+            self.expression = _accessor(self.attrName)
+        self.reset()
+
+    @property
+    def value(self):
+        context = _currentContext()
+        if context is not None:
+            state = context._aggregates.get(self)
+            if state is not None:
+                return state._value
+        return self._value
+
+    def reset(self):
+        self._value = None
+
+    def update(self, data_item):
+        value = self.expression(data_item)
+        if value is not None:
+            self._add(value)
+
+    def _add(self, value):
+        pass
+
+    # Saving and restoring the state allows painting after the layout
+    def _save(self):
+        return self._value
+
+    def _restore(self, state):
+        self._value = state
+
+    def _reduce(self, values):
+        """ Returns the state of the aggregate over a sequence of values """
+        aggregate = copy.copy(self)
+        aggregate.reset()
+        for value in values:
+            if value is not None:
+                aggregate._add(value)
+        return aggregate._save()
+
+
+def _isNumericArray(values):
+    dtype = getattr(values, 'dtype', None)
+    return dtype is not None and dtype.kind in 'biuf'
+
+
+class Sum(Aggregate):
+    """ Sum of values, 0 if none """
+
+    def reset(self):
+        self._value = 0
+
+    def _add(self, value):
+        self._value += value
+
+    def _reduce(self, values):
+        if _isNumericArray(values):
+            return values.sum().item()
+        return super(Sum, self)._reduce(values)
+
+
+class Count(Aggregate):
+    """
+        Count of values, or of data items if neither attrName nor expression
+        are set.
+    """
+
+    def reset(self):
+        self._value = 0
+
+    def update(self, data_item):
+        if self.expression is None or self.expression(data_item) is not None:
+            self._value += 1
+
+    def _reduce(self, values):
+        if self.expression is None or _isNumericArray(values):
+            return len(values)
+        return sum(1 for value in values if value is not None)
+
+
+class Min(Aggregate):
+    """ Minimum value, None if none """
+
+    def _add(self, value):
+        if self._value is None or value < self._value:
+            self._value = value
+
+    def _reduce(self, values):
+        if _isNumericArray(values) and len(values):
+            return values.min().item()
+        return super(Min, self)._reduce(values)
+
+
+class Max(Aggregate):
+    """ Maximum value, None if none """
+
+    def _add(self, value):
+        if self._value is None or value > self._value:
+            self._value = value
+
+    def _reduce(self, values):
+        if _isNumericArray(values) and len(values):
+            return values.max().item()
+        return super(Max, self)._reduce(values)
+
+
+class Avg(Aggregate):
+    """ Average value, None if none """
+
+    def reset(self):
+        self._value = None
+        self._sum = 0
+        self._count = 0
+
+    def _add(self, value):
+        self._sum += value
+        self._count += 1
+        self._value = self._sum / float(self._count)
+
+    def _reduce(self, values):
+        if _isNumericArray(values) and len(values):
+            return values.mean().item()
+        return super(Avg, self)._reduce(values)
+
+
+class DistinctCount(Aggregate):
+    """ Count of distinct values """
+
+    def reset(self):
+        self._value = 0
+        self._values = set()
+
+    def _add(self, value):
+        self._values.add(value)
+        self._value = len(self._values)
 
 
 class Element(BaseElement):
@@ -817,6 +2461,10 @@ class Element(BaseElement):
     def render(painter, rect, data_item):
         pass  # Stub
 
+    def _isStatic(self):
+        """ True if the element renders the same for any data item """
+        return False
+
 
 class TextElement(Element):
     """
@@ -836,48 +2484,68 @@ class TextElement(Element):
     """
     textOptions = QTextOption()
     noRepeat = False
-    _lastText = None
     richText = False
     expand = False
 
+    def _document(self, painter, text):
+        font = self.font or painter.font()
+        textDocuments = getattr(painter, 'textDocuments', None)
+        if textDocuments is not None:
+            return textDocuments.document(text, font, self.width,
+                painter.device())
+        doc = QTextDocument()
+        _layoutDocument(doc, text, font, self.width, painter.device())
+        return doc
+
     def _expandHeight(self, painter, text):
         if self.richText:
-            doc = QTextDocument()
-            font = self.font or painter.font()
-            doc.setDefaultFont(font)
-            doc.setTextWidth(self.width)
-            doc.setHtml(text)
+            doc = self._document(painter, text)
             return max(self.height, doc.size().height())
         else:
             font = self.font or painter.font()
-            fm = QFontMetricsF(font)
-            bound_rect = fm.boundingRect(
-                QRectF(self.left, self.top, self.width, self.height),
-                self.textOptions.flags() | Qt.TextWordWrap,
-                text)
-            return max(self.height, bound_rect.height())
+            flags = self.textOptions.flags() | Qt.TextWordWrap
+            textMetrics = getattr(painter, 'textMetrics', None)
+            if textMetrics is not None:
+                height = textMetrics.height(font, self.width, flags, text)
+            else:
+                height = _textHeight(font, self.width, flags, text)
+            return max(self.height, height)
+
+    def _renderText(self, painter, data_item):
+        return self._text(data_item)
+
+    def _paintedText(self, painter, data_item):
+        """
+            Returns the text painted: when painting a layout, the one found
+            when placing the band, if any, see LayoutItem.
+        """
+        texts = _placedTexts(painter)
+        if self in texts:
+            return texts[self]
+        return self._renderText(painter, data_item)
 
     def renderHeight(self, painter, data_item):
         if self.expand:
-            text = self._text(data_item)
+            text = self._paintedText(painter, data_item)
             return self._expandHeight(painter, text)
         else:
             return self.height
 
     def render(self, painter, rect, data_item):
-        if self.on_before_print is not None:
+        # Events of placed texts already fired when placing the band
+        if (self.on_before_print is not None
+                and self not in _placedTexts(painter)):
             self.on_before_print(self, data_item)
 
-        text = self._text(data_item)
+        text = self._paintedText(painter, data_item)
 
-        if self.noRepeat and self._lastText == text:
-            return
-        self._lastText = text
+        if self.noRepeat:
+            lastTexts = _painterContext(painter).lastTexts
+            if self in lastTexts and lastTexts[self] == text:
+                return
+            lastTexts[self] = text
 
         self.renderSetup(painter)
-        if self.font:
-            parent_font = painter.font()
-            painter.setFont(self.font)
         if self.expand:
             effectiveHeight = self._expandHeight(painter, text)
         else:
@@ -888,19 +2556,25 @@ class TextElement(Element):
         self.renderBorderAndBackground(painter, elementRect)
 
         if self.richText:
-            doc = QTextDocument()
-            doc.documentLayout().setPaintDevice(painter.device())
-            doc.setPageSize(elementRect.size())
-            doc.setDefaultFont(painter.font())
-            doc.setHtml(text)
+            # Laid out to the element width only, as measured, a page size
+            # would make no difference but for texts not fitting
+            doc = self._document(painter, text)
             painter.translate(elementRect.topLeft())
             doc.drawContents(painter)
             painter.resetTransform()
         else:
             textOptions = self.textOptions
-            textOptions.setWrapMode(QTextOption.WordWrap)
-            painter.drawText(elementRect, str(text),
-                textOptions)
+            if textOptions.wrapMode() != QTextOption.WordWrap:
+                # Shared by the elements, so it's left untouched
+                textOptions = QTextOption(textOptions)
+                textOptions.setWrapMode(QTextOption.WordWrap)
+            text = str(text)
+            staticTexts = getattr(painter, 'staticTexts', None)
+            # Tabs are laid out other way by QStaticText
+            if staticTexts is not None and text and '\t' not in text:
+                staticTexts.draw(painter, elementRect, text, textOptions)
+            else:
+                painter.drawText(elementRect, text, textOptions)
         self.renderTearDown(painter)
 
 
@@ -918,6 +2592,39 @@ class Label(TextElement):
     def _text(self, data_item):
         return self.text
 
+    def _isStatic(self):
+        return (self.on_before_print is None and not self.noRepeat
+            and not self.richText)
+
+
+class PageNumber(TextElement):
+    """
+        Page numbering text element.
+
+        Inherits TextElement.
+
+        Properties
+        ----------
+        * formatStr: str, Python standard formatting string, formatted using
+            the page and pageCount keyword arguments.
+            Default "{page}", i.e. use "Page {page} of {pageCount}" for
+            including the total page count.
+
+        Using the total page count requires the report being laid out before
+        painting it, render() takes care of it.
+    """
+    formatStr = '{page}'
+
+    @property
+    def usesPageCount(self):
+        return '{pageCount' in self.formatStr
+
+    def _renderText(self, painter, data_item):
+        context = _painterContext(painter)
+        return self.formatStr.format(page=context.page,
+            pageCount=context.pageCount)
+
+
 class FranqAttributeError(AttributeError):
     pass
 
@@ -934,7 +2641,9 @@ class Field(TextElement):
 
         Properties
         ----------
-        * attrName: str, attribute name.
+        * attrName: str, attribute name. A dotted path can be used for
+            reaching attributes of attributes, and mapping keys and sequence
+            indexes work as well, i.e. 'customer.name', 'lines.0.amount'.
         * formatter: callable, optional, default None.
         * formatStr: str, optional Python standard formatting string,
             default None.
@@ -944,25 +2653,24 @@ class Field(TextElement):
     formatter = None
 
     def _get_value(self, data_item):
-        value = None
-
-        propertyparts = self.attrName.split('.')
-
         try:
-            obj = data_item
-            prop = propertyparts.pop(0)
-            while propertyparts:
-                obj = getattr(obj, prop)
-                prop = propertyparts.pop(0)
-            value = getattr(obj, prop)
+            return _accessor(self.attrName)(data_item)
         except AttributeError:
+            # Find out the missing part for the message
+            obj = data_item
+            for prop in self.attrName.split('.'):
+                try:
+                    obj = _accessor(prop)(obj)
+                except AttributeError:
+                    break
             raise FranqAttributeError("Attribute {} ({}) not found"
                 " in the model {}({})"
                 .format(self.attrName, prop, data_item, type(data_item)))
-        return value
 
     def _text(self, data_item):
-        v = self._get_value(data_item)
+        return self._format(self._get_value(data_item))
+
+    def _format(self, v):
         if self.formatter:
             try:
                 return self.formatter(v)
@@ -978,6 +2686,26 @@ class Field(TextElement):
             return str(v)
 
 
+class AggregateField(Field):
+    """
+        Aggregate value text element.
+
+        Inherits Field, so values are formatted the same way.
+
+        Properties
+        ----------
+        * aggregate: Aggregate to print.
+    """
+    aggregate = None
+
+    def _get_value(self, data_item):
+        return self.aggregate.value
+
+    def _renderText(self, painter, data_item):
+        aggregate = _painterContext(painter).aggregate(self.aggregate)
+        return self._format(aggregate._value)
+
+
 class Function(TextElement):
     """
         Dynamic Function based text element.
@@ -988,28 +2716,36 @@ class Function(TextElement):
         ----------
         * func: callable, usually a lambda or a report method, receives the
             data item as parameter, returns str value to render.
+        * usesPageCount: bool, func uses the page count, read from the
+            report context, so the report must be laid out before painting.
+            Default None, meaning guessed from func reading some pageCount
+            attribute.
     """
-
-    def __init__(self, **kw):
-        super(TextElement, self).__init__(**kw)
-        self._last_id = None
-        self._last_value = None
+    usesPageCount = None
 
     def _text(self, data_item):
+        return self.func(data_item)
+
+    def _usesPageCount(self):
+        if self.usesPageCount is not None:
+            return self.usesPageCount
+        code = getattr(self.func, '__code__', None)
+        return code is not None and 'pageCount' in code.co_names
+
+    def _renderText(self, painter, data_item):
         # Avoid calling func twice with the same argument
-        # _last_id is reset in render() as the main reason to do caching
-        # is to reuse the value for renderHeight() and render() calls.
-        # Also, when the Function object is created as a report class member
-        # the _last_id is preserved between report renderings leading
-        # to incorrect behaviour if caching is allowed
-        if id(data_item) != self._last_id:
-            self._last_id = id(data_item)
-            self._last_value = self.func(data_item)
-        return self._last_value
+        # The value is forgotten in render() as the main reason to do
+        # caching is to reuse the value for renderHeight() and render() calls
+        functionValues = _painterContext(painter).functionValues
+        last = functionValues.get(self)
+        if last is None or last[0] != id(data_item):
+            last = functionValues[self] = (id(data_item),
+                self.func(data_item))
+        return last[1]
 
     def render(self, painter, rect, data_item):
         super(Function, self).render(painter, rect, data_item)
-        self._last_id = None
+        _painterContext(painter).functionValues.pop(self, None)
 
 
 class Line(Element):
@@ -1018,6 +2754,9 @@ class Line(Element):
 
         Inherits Element.
     """
+    def _isStatic(self):
+        return self.on_before_print is None
+
     def render(self, painter, rect, data_item):
         if self.on_before_print is not None:
             self.on_before_print(self, data_item)
@@ -1025,7 +2764,8 @@ class Line(Element):
         self.renderSetup(painter)
         left = self.left + rect.left()
         top = self.top + rect.top()
-        painter.drawLine(left, top, left + self.width, top + self.height)
+        painter.drawLine(QPointF(left, top),
+            QPointF(left + self.width, top + self.height))
         self.renderTearDown(painter)
 
 
@@ -1037,6 +2777,9 @@ class Box(Element):
     """
     pen = QColor("black")  # FIXME: Keep inheritance while making border optional?
 
+    def _isStatic(self):
+        return self.on_before_print is None
+
     def render(self, painter, rect, data_item):
         if self.on_before_print is not None:
             self.on_before_print(self, data_item)
@@ -1063,32 +2806,76 @@ class Image(Element):
         * image: QImage of the image, default None.
         * pixmap: QPixmap of the image, default None.
         * fileName: name of the image file, used if both image and pixmap are
-            None, default None.
+            None, default None. Files are loaded through imageCache, so
+            they are decoded just once, and scaled down to the element size.
     """
     fileName = None
     pixmap = None
     image = None
 
+    def _isStatic(self):
+        return self.on_before_print is None
+
+    def _getImage(self, painter, data_item):
+        if self.fileName:
+            return imageCache.image(self.fileName, self.width, self.height)
+        return None
+
     def render(self, painter, rect, data_item):
 
         if self.on_before_print is not None:
             self.on_before_print(self, data_item)
 
-        if not self.image and not self.pixmap:
-            if self.fileName:
-                self.image = QImage(self.fileName)
-            else:
+        image = self.image
+        if not image and not self.pixmap:
+            image = self._getImage(painter, data_item)
+            if image is None or image.isNull():
                 return
 
-        if self.image:
+        if image:
             painter.drawImage(
                 QRectF(self.left + rect.left(), self.top + rect.top(),
                     self.width, self.height),
-                self.image,
-                QRectF(0, 0, self.image.width(), self.image.height()))
+                image,
+                QRectF(0, 0, image.width(), image.height()))
         else:
             painter.drawPixmap(
                 QRectF(self.left + rect.left(), self.top + rect.top(),
                     self.width, self.height),
                 self.pixmap,
                 QRectF(0, 0, self.pixmap.width(), self.pixmap.height()))
+
+
+class ImageField(Image):
+    """
+        Data item based image element, for an image by data item, like
+        product photos.
+
+        Inherits Image.
+
+        Properties
+        ----------
+        * attrName: str, attribute name, as in Field. Its value is either the
+            name of an image file, the encoded image data, as bytes, or
+            a QImage. No image is rendered for None.
+        * readAhead: int, number of data items whose images are decoded
+            ahead, in a pool of threads, while painting, default 16.
+    """
+    attrName = None
+    readAhead = 16
+
+    def _isStatic(self):
+        return False
+
+    def _source(self, data_item):
+        return _accessor(self.attrName)(data_item)
+
+    def _getImage(self, painter, data_item):
+        source = self._source(data_item)
+        if source is None:
+            return None
+        images = getattr(painter, 'images', None)
+        if images is not None:
+            return images.image(source, self.width, self.height)
+        return _decodeImage(source, int(round(self.width)),
+            int(round(self.height)))
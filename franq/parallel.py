@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Parallel painting of a report layout across a pool of processes.
+
+    The report is laid out once in the calling process, then the workers,
+    forked from it, inherit the report and its layout, so nothing but page
+    ranges and file names travel between processes. Each worker paints its
+    range into a PDF file of its own, and finally the files are concatenated
+    into the requested one.
+
+    Forking a process having other threads running is unsafe: just the
+    forking thread is copied, so locks held by the others, i.e. within Qt or
+    a database driver, stay locked forever in the workers. Render from a
+    process not running other threads, like CursorDataSource or
+    render_async() ones.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from PyQt5.QtPrintSupport import QPrinter
+
+
+# Report and layout being painted, inherited by the forked workers
+_job = None
+
+
+def _paintPages(args):
+    fromPage, toPage, fileName = args
+    report, layout = _job
+    printer = QPrinter()
+    printer.setOutputFormat(QPrinter.PdfFormat)
+    printer.setOutputFileName(fileName)
+    printer.setFromTo(fromPage, toPage)
+    report.paint(printer, layout)
+    return fileName
+
+
+def _concatenate(fileNames, fileName):
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        raise ImportError("Parallel rendering requires pypdf for joining "
+            "the PDF files painted by each process")
+    writer = PdfWriter()
+    for name in fileNames:
+        writer.append(name)
+    # Each file embeds its own copy of fonts and images, keep one of those
+    # being identical, if pypdf is recent enough to tell
+    compress = getattr(writer, 'compress_identical_objects', None)
+    if compress is not None:
+        compress()
+    with open(fileName, 'wb') as f:
+        writer.write(f)
+
+
+def _pageRanges(firstPage, lastPage, count):
+    size = max(1, -(-(lastPage - firstPage + 1) // count))
+    return [(start, min(start + size - 1, lastPage))
+        for start in range(firstPage, lastPage + 1, size)]
+
+
+def renderParallel(report, printer, dataSources, processes=None,
+        chunksPerProcess=1):
+    """
+        Renders report into printer, which must be set to PDF output, laying
+        it out once and painting page ranges in a pool of processes.
+
+        Page ranges can be made smaller than a process share (see
+        chunksPerProcess), balancing the load when some pages are a lot
+        costlier than others. But each range embeds its own fonts into the
+        output, so by default there is a single range per process.
+
+        Where processes can't be forked, the layout is painted right away.
+    """
+    global _job
+    fileName = printer.outputFileName()
+    if not fileName:
+        raise ValueError("Parallel rendering requires a printer with "
+            "a PDF output file name")
+
+    layout = report.layout(**dataSources)
+    firstPage = printer.fromPage() or 1
+    lastPage = min(printer.toPage() or layout.pageCount, layout.pageCount)
+    processes = processes or os.cpu_count() or 1
+
+    if (processes == 1 or lastPage <= firstPage
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        report.paint(printer, layout)
+        return layout
+
+    tempDir = tempfile.mkdtemp(prefix='franq')
+    jobs = [(start, end, os.path.join(tempDir, '{:08d}.pdf'.format(start)))
+        for start, end in _pageRanges(firstPage, lastPage,
+            processes * chunksPerProcess)]
+    _job = (report, layout)
+    try:
+        pool = multiprocessing.get_context('fork').Pool(processes)
+        try:
+            fileNames = pool.map(_paintPages, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        _concatenate(fileNames, fileName)
+    finally:
+        _job = None
+        shutil.rmtree(tempDir, ignore_errors=True)
+    return layout
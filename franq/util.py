@@ -1,8 +1,84 @@
 # -*- coding: utf-8 -*-
 
+import heapq
+from itertools import islice
+from operator import itemgetter
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import tempfile
+
 
 def counter(start=1, step=1):
     page = start
     while True:
         yield page
         page += 1
+
+
+def sortedItems(items, key=None, bufferSize=100000):
+    """
+        Returns the items sorted by key, stable as sorted() is.
+
+        Up to bufferSize items are sorted in memory, returning a list. Above
+        it, items are sorted in runs of bufferSize items, spilled to temporary
+        files, and merged from them while iterating the returned iterable, so
+        memory use stays bounded. Items must be picklable then. It can be
+        iterated several times, even at once, as lists can.
+    """
+    if key is None:
+        key = lambda item: item
+    iterator = iter(items)
+    runs = []
+    while True:
+        run = list(islice(iterator, bufferSize))
+        if not runs and len(run) < bufferSize:
+            run.sort(key=key)
+            return run
+        if not run:
+            break
+        runs.append(_spill(sorted(((key(item), item) for item in run),
+            key=itemgetter(0))))
+    return _SortedRuns(runs)
+
+
+def _spill(run):
+    runFile = tempfile.TemporaryFile()
+    for keyItem in run:
+        pickle.dump(keyItem, runFile, pickle.HIGHEST_PROTOCOL)
+    runFile.seek(0)
+    return runFile
+
+
+def _readRun(runFile, runIndex):
+    # Decorated by run and position in it, so merging keeps the order of
+    # equal keys, and never compares the items themselves
+    # Each reader keeps its own offset, as several can read the same run
+    offset = 0
+    position = 0
+    while True:
+        runFile.seek(offset)
+        try:
+            key, item = pickle.load(runFile)
+        except EOFError:
+            return
+        offset = runFile.tell()
+        yield key, runIndex, position, item
+        position += 1
+
+
+class _SortedRuns(object):
+    """
+        Items merged from sorted runs spilled to temporary files, which are
+        removed when it's garbage collected.
+    """
+
+    def __init__(self, runs):
+        self._runs = runs
+
+    def __iter__(self):
+        for key, runIndex, position, item in heapq.merge(
+                *[_readRun(runFile, i) for i, runFile in
+                    enumerate(self._runs)]):
+            yield item
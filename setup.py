@@ -53,4 +53,7 @@ setup(
     license='GPL',
     install_requires=[
         #'PyQt5'
-        ])
+        ],
+    extras_require={
+        'parallel': ['pypdf'],
+        })
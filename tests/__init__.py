@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Franq tests, rendering into PDF files in a temporary directory, with the
+    offscreen Qt platform so no display is needed.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtPrintSupport import QPrinter
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication.instance() or QApplication([])
+
+from franq import Field, Function, Label, AggregateField, ImageField
+
+
+class ReportTestCase(unittest.TestCase):
+    """ Base of test cases rendering reports """
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp(prefix='franqtest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir, ignore_errors=True)
+
+    def printer(self, name='report.pdf', fromPage=0, toPage=0):
+        printer = QPrinter()
+        printer.setOutputFormat(QPrinter.PdfFormat)
+        printer.setOutputFileName(os.path.join(self.tempDir, name))
+        printer.setFromTo(fromPage, toPage)
+        return printer
+
+
+class Item(object):
+    """ Data item with an index, a name and any other attributes given """
+
+    def __init__(self, i, **attrs):
+        self.i = i
+        self.name = 'name {}'.format(i)
+        self.__dict__.update(attrs)
+
+
+class Recording(object):
+    """ Mixin for elements appending what they paint to a list, in painted
+        order
+
+    Properties
+    ----------
+    texts: list
+        The list recorded into
+    record: callable
+        Function of (element, painter, data_item) returning what is
+        recorded, called before painting. By default, the text painted
+    """
+
+    record = None
+
+    def render(self, painter, rect, data_item):
+        if self.record is None:
+            self.texts.append(self._paintedText(painter, data_item))
+        else:
+            self.texts.append(self.record(self, painter, data_item))
+        super(Recording, self).render(painter, rect, data_item)
+
+
+class RecordingField(Recording, Field):
+    pass
+
+
+class RecordingFunction(Recording, Function):
+    pass
+
+
+class RecordingLabel(Recording, Label):
+    pass
+
+
+class RecordingAggregateField(Recording, AggregateField):
+    pass
+
+
+class RecordingImageField(Recording, ImageField):
+    pass
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Asyncio rendering tests.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from franq import Report, DetailBand, Field, mm
+
+from . import ReportTestCase, Item
+
+
+class ItemsReport(Report):
+    detail = DetailBand(dataSet='items', height=5 * mm,
+        elements=[Field(attrName='name')])
+
+
+async def slowItems():
+    for i in range(1000):
+        await asyncio.sleep(0.02)
+        yield Item(i)
+
+
+async def failingItems():
+    for i in range(300):
+        yield Item(i)
+    raise RuntimeError('connection lost')
+
+
+class RenderAsyncTest(ReportTestCase):
+
+    def testError(self):
+        printer = self.printer()
+        with self.assertRaises(RuntimeError):
+            asyncio.run(ItemsReport().render_async(printer,
+                items=failingItems()))
+        self.assertFalse(printer.paintingActive())
+
+    def testTimeout(self):
+        printer = self.printer()
+        executor = ThreadPoolExecutor(1)
+
+        async def render():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(executor)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(ItemsReport().render_async(printer,
+                    items=slowItems()), 0.2)
+            # The rendering thread stops, so the worker gets free
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, printer.paintingActive), 5)
+
+        self.assertFalse(asyncio.run(render()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Columnar data tests, with NumPy when available and with plain lists.
+"""
+
+import sys
+import unittest
+from unittest import mock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from franq import Report, DetailBand, DetailGroup, mm
+from franq.datasource import (DataSource, ColumnarDataSource,
+    ColumnarRow, Record, dataSource)
+
+from . import ReportTestCase, RecordingField
+
+
+KEYS = ['a', 'a', 'b', 'b', 'b', 'c']
+SUBKEYS = [1, 2, 2, 2, 3, 3]
+
+
+class ColumnarTest(unittest.TestCase):
+
+    columns = staticmethod(list)
+
+    def setUp(self):
+        # Plain lists take the path used without NumPy
+        patcher = mock.patch.dict(sys.modules, {'numpy': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dataSource(self):
+        return ColumnarDataSource({'key': self.columns(KEYS),
+            'subkey': self.columns(SUBKEYS)})
+
+    def testRows(self):
+        ds = self.dataSource()
+        # Positioned at the first row
+        rows = [ds.getDataItem()] + [ds.nextDataItem()
+            for i in range(ds.length - 1)]
+        self.assertIsInstance(rows[0], ColumnarRow)
+        self.assertEqual([(row.key, row['subkey']) for row in rows],
+            list(zip(KEYS, SUBKEYS)))
+        self.assertEqual([row.key for row in ds.reiterate()], KEYS)
+
+    def testGroupBreaks(self):
+        ds = self.dataSource()
+        self.assertEqual(ds.groupBreaks(['key', 'subkey']),
+            [2, 1, 0, 2, 1, 0])
+        self.assertIsNone(ds.groupBreaks(['missing']))
+
+    def testGroupSegments(self):
+        ds = self.dataSource()
+        self.assertEqual(ds.groupSegments(['key', 'subkey']),
+            [[0, 2, 5], [0, 1, 2, 4, 5]])
+
+    def testSortedBy(self):
+        ds = ColumnarDataSource({'key': self.columns(['b', 'a', 'b']),
+            'n': self.columns([1, 2, 3])}).sortedBy(['key'])
+        self.assertEqual([(row.key, row.n) for row in ds.reiterate()],
+            [('a', 2), ('b', 1), ('b', 3)])
+        self.assertIsNone(ds.sortedBy(['missing']))
+
+    def testUnequalLengths(self):
+        self.assertRaises(ValueError, ColumnarDataSource,
+            {'key': self.columns(KEYS), 'subkey': self.columns([1])})
+
+
+@unittest.skipIf(numpy is None, 'requires NumPy')
+class NumPyColumnarTest(ColumnarTest):
+
+    columns = staticmethod(lambda values: numpy.array(values))
+
+    def setUp(self):
+        pass
+
+    def testStructuredArray(self):
+        array = numpy.array(list(zip(KEYS, SUBKEYS)),
+            dtype=[('key', 'U1'), ('subkey', int)])
+        ds = dataSource(array)
+        self.assertIsInstance(ds, ColumnarDataSource)
+        self.assertEqual(ds.groupBreaks(['key', 'subkey']),
+            [2, 1, 0, 2, 1, 0])
+
+
+class DataSourceTest(unittest.TestCase):
+
+    def testColumnarDetection(self):
+        self.assertIsInstance(dataSource({'key': KEYS}), ColumnarDataSource)
+        for dataSet in [Record(key='a', subkey=1), {'lines': {'a': [1]}},
+                {'name': 'text'}, {}, [{'key': 'a'}]]:
+            ds = dataSource(dataSet)
+            self.assertNotIsInstance(ds, ColumnarDataSource)
+            self.assertIsInstance(ds, DataSource)
+
+
+class ColumnarReportTest(ReportTestCase):
+
+    def testGroups(self):
+        texts = []
+
+        class ColumnarReport(Report):
+            detail = DetailBand(dataSet='rows', height=5 * mm,
+                groups=[DetailGroup(attrName='key', header=DetailBand(
+                    height=5 * mm, elements=[RecordingField(texts=texts,
+                        attrName='key')]))],
+                elements=[RecordingField(texts=texts, attrName='subkey')])
+
+        ColumnarReport().render(self.printer(),
+            rows={'key': KEYS, 'subkey': SUBKEYS})
+        self.assertEqual(texts, ['a', '1', '2', 'b', '2', '2', '3', 'c',
+            '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Concurrent renders of the same report.
+"""
+
+import threading
+import time
+import unittest
+
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter
+
+from franq import (Report, Band, DetailBand, DetailGroup, AggregateField,
+    Field, Function, PageNumber, Sum, mm)
+
+from . import ReportTestCase, Item, RecordingField
+
+
+def keyedItems(indexes):
+    return [Item(i, key='k{}'.format(i // 20)) for i in indexes]
+
+
+def threadText(element, painter, item):
+    return (threading.current_thread().name,
+        element._paintedText(painter, item), painter.font().family())
+
+
+def skipOdd(band, item):
+    band.renderBand = item.i % 2 == 0
+    # Let the other thread run meanwhile
+    time.sleep(0.0005)
+
+
+def concurrentReport(texts):
+    total = Sum('i')
+
+    class ConcurrentReport(Report):
+        font = QFont('Serif', 9)
+        detail = DetailBand(dataSet='items', height=5 * mm,
+            on_before_print=skipOdd,
+            groups=[DetailGroup(attrName='key', aggregates=[total],
+                footer=Band(height=5 * mm, elements=[
+                    AggregateField(aggregate=total)]))],
+            elements=[
+                RecordingField(texts=texts, record=threadText,
+                    attrName='key', noRepeat=True, font=QFont('Sans', 12)),
+                RecordingField(texts=texts, record=threadText, left=40 * mm,
+                    attrName='name', pen=QColor('blue'))])
+
+    return ConcurrentReport()
+
+
+class ConcurrencyTest(ReportTestCase):
+
+    def testRenderBand(self):
+        texts = []
+        report = concurrentReport(texts)
+        datasets = {'a': keyedItems(range(200)),
+            'b': keyedItems(range(1, 151))}
+        for name, items in datasets.items():
+            thread = threading.Thread(target=report.render, name=name,
+                args=(self.printer(name + '.pdf'),), kwargs={'items': items})
+            thread.start()
+            thread.join()
+        expected = list(texts)
+        del texts[:]
+
+        threads = [threading.Thread(target=report.render, name=name,
+            args=(self.printer(name + '2.pdf'),), kwargs={'items': items})
+            for name, items in datasets.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Each thread painted the same, in the same order
+        for name in datasets:
+            self.assertEqual([text for text in texts if text[0] == name],
+                [text for text in expected if text[0] == name])
+        self.assertIn(('a', 'name 2', 'Serif'), expected)
+        self.assertNotIn(('a', 'name 1', 'Serif'), expected)
+
+
+class PlainPainterTest(unittest.TestCase):
+
+    def testElements(self):
+        image = QImage(400, 100, QImage.Format_RGB32)
+        painter = QPainter(image)
+        rect = QRectF(0, 0, 400, 100)
+        try:
+            for element in [Field(attrName='name', noRepeat=True),
+                    PageNumber(formatStr='{page} of {pageCount}'),
+                    AggregateField(aggregate=Sum('i')),
+                    Function(func=lambda item: item.name)]:
+                element.render(painter, rect, Item(1))
+                self.assertTrue(element.renderHeight(painter, Item(1)))
+        finally:
+            painter.end()
+        self.assertEqual(PageNumber(formatStr='{page} of {pageCount}'
+            )._renderText(painter, None), '1 of 1')
+
+
+if __name__ == '__main__':
+    unittest.main()
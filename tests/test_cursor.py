@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    CursorDataSource tests, over SQLite.
+"""
+
+import sqlite3
+import unittest
+
+from franq import Report, DetailBand, mm
+from franq.datasource import CursorDataSource, Record
+
+from . import ReportTestCase, RecordingField
+
+
+class CountingCursor(sqlite3.Cursor):
+    """ Cursor recording the number of rows fetched by each fetchmany() """
+
+    fetched = None
+    failAt = None
+
+    def fetchmany(self, size):
+        if self.fetched is None:
+            self.fetched = []
+        if len(self.fetched) == self.failAt:
+            raise sqlite3.OperationalError('connection lost')
+        rows = super(CountingCursor, self).fetchmany(size)
+        self.fetched.append(len(rows))
+        return rows
+
+
+def itemsReport(texts, attrName):
+
+    class ItemsReport(Report):
+        detail = DetailBand(dataSet='items', height=5 * mm,
+            elements=[RecordingField(texts=texts, attrName=attrName)])
+
+    return ItemsReport()
+
+
+class CursorDataSourceTest(ReportTestCase):
+
+    def setUp(self):
+        super(CursorDataSourceTest, self).setUp()
+        self.connection = sqlite3.connect(':memory:',
+            check_same_thread=False)
+        self.connection.execute('CREATE TABLE items (i INTEGER, name TEXT)')
+        self.connection.executemany('INSERT INTO items VALUES (?, ?)',
+            [(i, 'name {}'.format(i)) for i in range(1000)])
+
+    def tearDown(self):
+        self.connection.close()
+        super(CursorDataSourceTest, self).tearDown()
+
+    def cursor(self, count=1000, failAt=None):
+        cursor = self.connection.cursor(CountingCursor)
+        cursor.failAt = failAt
+        cursor.execute('SELECT i, name FROM items WHERE i < ? ORDER BY i',
+            (count,))
+        return cursor
+
+    def testBatches(self):
+        cursor = self.cursor(25)
+        ds = CursorDataSource(cursor, batchSize=10)
+        texts = []
+        itemsReport(texts, '1').render(self.printer(), items=ds)
+        self.assertEqual(cursor.fetched, [10, 10, 5, 0])
+        self.assertEqual(texts, ['name {}'.format(i) for i in range(25)])
+
+    def testRecords(self):
+        ds = CursorDataSource(self.cursor(25), batchSize=10, records=True)
+        self.assertIsInstance(ds.getDataItem(), Record)
+        texts = []
+        itemsReport(texts, 'name').render(self.printer(), items=ds)
+        self.assertEqual(texts, ['name {}'.format(i) for i in range(25)])
+
+    def testFetchError(self):
+        ds = CursorDataSource(self.cursor(failAt=2), batchSize=10,
+            records=True)
+        printer = self.printer()
+        with self.assertRaises(sqlite3.OperationalError):
+            itemsReport([], 'name').render(printer, items=ds)
+        self.assertFalse(ds._thread.is_alive())
+        self.assertFalse(printer.paintingActive())
+
+    def testPageRange(self):
+        cursor = self.cursor()
+        ds = CursorDataSource(cursor, batchSize=10, queueSize=2,
+            records=True)
+        texts = []
+        itemsReport(texts, 'name').render(self.printer(toPage=1), items=ds)
+        # Rendering stopped at the end of the page, and so did fetching
+        self.assertFalse(ds._thread.is_alive())
+        self.assertLess(sum(cursor.fetched), 1000)
+        self.assertEqual(texts, ['name {}'.format(i)
+            for i in range(len(texts))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Data source tests.
+"""
+
+import unittest
+
+from franq.datasource import _accessor
+
+
+class Customer(object):
+
+    def __init__(self, name, addresses):
+        self.name = name
+        self.addresses = addresses
+
+
+class AccessorTest(unittest.TestCase):
+
+    def testAttributes(self):
+        customer = Customer('Ann', [{'city': 'Rosario'}])
+        self.assertEqual(_accessor('name')(customer), 'Ann')
+        self.assertEqual(_accessor('addresses.0.city')(customer), 'Rosario')
+
+    def testNumberKeys(self):
+        item = {'totals': {'2024': 10, '2025': 20}}
+        self.assertEqual(_accessor('totals.2024')(item), 10)
+        self.assertEqual(_accessor('1')({1: 'int key'}), 'int key')
+        self.assertEqual(_accessor('1')(('a', 'b')), 'b')
+
+    def testMissing(self):
+        self.assertRaises(AttributeError, _accessor('totals.2023'),
+            {'totals': {'2024': 10}})
+        self.assertRaises(AttributeError, _accessor('5'), ('a', 'b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
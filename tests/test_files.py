@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    CSV and JSON Lines data source tests.
+"""
+
+import decimal
+import io
+import os
+import unittest
+
+from franq import Report, DetailBand, mm
+from franq.datasource import (CsvDataSource, JsonLinesDataSource, Record,
+    DataSourceExausted)
+
+from . import ReportTestCase, RecordingFunction
+
+
+class FileDataSourceTest(ReportTestCase):
+
+    def write(self, name, text):
+        fileName = os.path.join(self.tempDir, name)
+        with io.open(fileName, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        return fileName
+
+    def records(self, ds):
+        records = []
+        item = ds.getDataItem()
+        while item is not None:
+            records.append(item)
+            try:
+                item = ds.nextDataItem()
+            except DataSourceExausted:
+                break
+        ds.close()
+        return records
+
+    def testCsv(self):
+        fileName = self.write('items.csv', u'name,price,notes\r\n'
+            u'apple,1.5,"red, green\r\nor yellow"\r\n'
+            u'pear,,\r\n'
+            u'\r\n'
+            u'ñandú,3,short\r\n')
+        records = self.records(CsvDataSource(fileName,
+            types={'price': float}))
+        self.assertIsInstance(records[0], Record)
+        self.assertEqual(records, [
+            {'name': 'apple', 'price': 1.5, 'notes': 'red, green\r\nor yellow'},
+            {'name': 'pear', 'price': None, 'notes': ''},
+            {'name': u'ñandú', 'price': 3.0, 'notes': 'short'}])
+        self.assertEqual(records[0].price, 1.5)
+
+    def testCsvColumns(self):
+        fileName = self.write('items.csv', u'a;b;c\n1;2;3\n4;5;6\n')
+        ds = CsvDataSource(fileName, columns=['c', 'a'], delimiter=';',
+            types={'c': int})
+        self.assertEqual(ds.names, ['a', 'c'])
+        self.assertEqual(self.records(ds), [{'a': '1', 'c': 3},
+            {'a': '4', 'c': 6}])
+
+    def testJsonLines(self):
+        fileName = self.write('items.jsonl',
+            u'{"name": "apple", "price": "1.50", "tags": ["red"]}\n'
+            u'\n'
+            u'{"name": "pear", "price": null}\n')
+        records = self.records(JsonLinesDataSource(fileName,
+            columns=['name', 'price'], types={'price': decimal.Decimal}))
+        self.assertEqual(records, [
+            {'name': 'apple', 'price': decimal.Decimal('1.50')},
+            {'name': 'pear', 'price': None}])
+        records = self.records(JsonLinesDataSource(fileName))
+        self.assertEqual(records[0].tags, ['red'])
+
+    def testEmptyFile(self):
+        fileName = self.write('empty.csv', u'')
+        self.assertIsNone(CsvDataSource(fileName).getDataItem())
+
+    def testFunctionsOnly(self):
+        texts = []
+
+        class PricesReport(Report):
+            detail = DetailBand(dataSet='items', height=5 * mm,
+                elements=[RecordingFunction(texts=texts,
+                    func=lambda item: '{name} {price}'.format(**item))])
+
+        report = PricesReport()
+        # Names read by expressions can't be found out
+        self.assertEqual(report.fieldNames('items'), set())
+        fileName = self.write('items.csv', u'name,price\napple,1\npear,2\n')
+        report.render(self.printer(), items=CsvDataSource(fileName,
+            columns=report.fieldNames('items')))
+        self.assertEqual(texts, ['apple 1', 'pear 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
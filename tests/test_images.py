@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Image element tests.
+"""
+
+import unittest
+from unittest import mock
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QColor, QImage
+
+from franq import Report, Band, DetailBand, DetailGroup, ImageField, mm
+from franq.franq import ImageDecoder
+
+from . import ReportTestCase, Item, RecordingImageField
+
+
+def pngData(i):
+    image = QImage(8, 8, QImage.Format_RGB32)
+    image.fill(QColor(i, 0, 0))
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return bytes(data)
+
+
+class CountingDecoder(ImageDecoder):
+    """ ImageDecoder recording the sources prefetched """
+
+    prefetched = []
+
+    def prefetch(self, source, width, height):
+        self.prefetched.append(source)
+        super(CountingDecoder, self).prefetch(source, width, height)
+
+
+def imagesKept(element, painter, item):
+    return len(painter.images._images)
+
+
+class ImageDecoderTest(ReportTestCase):
+
+    def testMaxSize(self):
+        decoder = ImageDecoder(maxSize=4)
+        for i in range(10):
+            image = decoder.image(pngData(i), 4, 4)
+            self.assertFalse(image.isNull())
+            self.assertLessEqual(len(decoder._images), 4)
+        decoder.close()
+
+    def testBufferKey(self):
+        decoder = ImageDecoder(maxSize=4)
+        source = memoryview(pngData(1))
+        key = decoder._key(source, 4, 4)
+        self.assertIsInstance(key[0], bytes)
+        # Not copied again
+        self.assertIs(decoder._key(source, 4, 4)[0], key[0])
+        self.assertFalse(decoder.image(source, 4, 4).isNull())
+        decoder.close()
+
+    def testPrefetchedOnce(self):
+        items = [Item(i, picture=memoryview(pngData(i))) for i in range(40)]
+
+        class ImagesReport(Report):
+            detail = DetailBand(dataSet='items', height=5 * mm,
+                elements=[ImageField(attrName='picture', readAhead=8,
+                    width=5 * mm, height=5 * mm)])
+
+        CountingDecoder.prefetched = prefetched = []
+        with mock.patch('franq.franq.ImageDecoder', CountingDecoder):
+            ImagesReport().render(self.printer(), items=items)
+        self.assertEqual(prefetched, [item.picture for item in items])
+
+    def testOutsideDetailBand(self):
+        sizes = []
+        maxSize = ImageDecoder().maxSize
+
+        # Every item starts a group, showing its image in the group header
+        class ImagesReport(Report):
+            detail = DetailBand(dataSet='items', height=1 * mm,
+                groups=[DetailGroup(attrName='i', header=Band(height=5 * mm,
+                    elements=[RecordingImageField(texts=sizes,
+                        record=imagesKept, attrName='picture', width=5 * mm, height=5 * mm)]))])
+
+        ImagesReport().render(self.printer(),
+            items=[Item(i, picture=pngData(i)) for i in range(maxSize + 10)])
+        self.assertEqual(len(sizes), maxSize + 10)
+        self.assertEqual(max(sizes), maxSize)
+
+
+if __name__ == '__main__':
+    unittest.main()
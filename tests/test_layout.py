@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Layout and painting tests.
+"""
+
+import unittest
+
+from PyQt5.QtGui import QImage, QPainter
+
+from franq import (Report, Band, DetailBand, DetailGroup, Function,
+    PageNumber, mm)
+from franq.franq import RenderPlan, LayoutRenderer
+
+from . import ReportTestCase, Item, RecordingFunction, RecordingLabel
+
+
+def pageText(element, painter, item):
+    return (painter.renderer.page, element._paintedText(painter, item))
+
+
+def items(count):
+    return [Item(i, key='k{}'.format(i // 40)) for i in range(count)]
+
+
+def groupedReport(texts, pageCount=False):
+    group = DetailGroup(attrName='key',
+        header=Band(height=8 * mm, elements=[RecordingFunction(texts=texts,
+            record=pageText,
+            func=lambda item: 'header {}'.format(group.value))]),
+        footer=Band(height=8 * mm, elements=[RecordingFunction(texts=texts,
+            record=pageText,
+            func=lambda item: 'footer {}'.format(group.value))]))
+
+    class GroupedReport(Report):
+        footer = Band(height=10 * mm, elements=[PageNumber(
+            formatStr='{page} of {pageCount}' if pageCount else '{page}')])
+        detail = DetailBand(dataSet='items', height=6 * mm, groups=[group],
+            elements=[RecordingFunction(texts=texts, record=pageText,
+                func=lambda item: '{} {}'.format(group.value, item.i))])
+
+    return GroupedReport()
+
+
+class LayoutTest(ReportTestCase):
+
+    def items(self):
+        return items(150)
+
+    def testPaintedGroupValues(self):
+        rendered = []
+        groupedReport(rendered).render(self.printer('rendered.pdf'),
+            items=self.items())
+        painted = []
+        report = groupedReport(painted)
+        report.paint(self.printer('painted.pdf'),
+            report.layout(items=self.items()))
+        self.assertEqual(painted, rendered)
+        self.assertIn((1, 'header k0'), rendered)
+
+    def testPageCountKeepsGroupValues(self):
+        rendered = []
+        groupedReport(rendered).render(self.printer('rendered.pdf'),
+            items=self.items())
+        counted = []
+        groupedReport(counted, pageCount=True).render(
+            self.printer('counted.pdf'), items=self.items())
+        self.assertEqual(counted, rendered)
+
+    def testPageRangeGroupValues(self):
+        texts = []
+        report = groupedReport(texts)
+        layout = report.layout(items=self.items())
+        report.paint(self.printer('all.pdf'), layout)
+        expected = [text for text in texts if text[0] == 3]
+        del texts[:]
+        report.paint(self.printer('range.pdf', 3, 3), layout)
+        self.assertTrue(expected)
+        self.assertEqual(texts, expected)
+
+
+class PagesReport(Report):
+
+    def setup(self):
+        self.texts = texts = []
+        self.footer = Band(height=10 * mm, elements=[RecordingFunction(
+            texts=texts, record=pageText, func=self.pages)])
+        self.detail = DetailBand(dataSet='items', height=6 * mm)
+
+    def pages(self, item):
+        return '{} of {}'.format(self.context.page, self.context.pageCount)
+
+
+class PageCountTest(ReportTestCase):
+
+    def testFunctionPageCount(self):
+        report = PagesReport()
+        self.assertTrue(RenderPlan(report).usesPageCount)
+        report.render(self.printer(), items=items(150))
+        self.assertEqual(report.texts, [(1, '1 of 4'), (2, '2 of 4'),
+            (3, '3 of 4'), (4, '4 of 4')])
+        self.assertIsNone(report.context)
+        self.assertIsNone(report.renderer)
+
+    def testRenderer(self):
+        report = PagesReport()
+        report.pages = lambda item: '{}/{}'.format(report.renderer.page,
+            report.renderer.pageCount)
+        report.footer.elements[0].func = report.pages
+        report.render(self.printer(), items=items(150))
+        self.assertEqual([text for page, text in report.texts],
+            ['1/4', '2/4', '3/4', '4/4'])
+
+    def testUsesPageCount(self):
+        self.assertFalse(Function(func=lambda item: item.i)._usesPageCount())
+        self.assertTrue(Function(func=lambda item: item.i,
+            usesPageCount=True)._usesPageCount())
+
+
+def eventsReport(texts):
+    label = RecordingLabel(texts=texts, text='')
+    counter = [0]
+
+    def setText(band, item):
+        label.text = 'item {}'.format(item.i)
+
+    def count(item):
+        counter[0] += 1
+        return str(counter[0])
+
+    def reset():
+        counter[0] = 0
+
+    def skipOdd(band, item):
+        band.renderBand = item.i % 2 == 0
+
+    class EventsReport(Report):
+        footer = Band(height=10 * mm, elements=[PageNumber(
+            formatStr='{page} of {pageCount}')])
+        detail = DetailBand(dataSet='items', height=6 * mm,
+            on_before_print=setText,
+            groups=[DetailGroup(attrName='key', on_new_group=reset)],
+            elements=[label, RecordingFunction(texts=texts, left=40 * mm,
+                func=count)],
+            child=Band(height=6 * mm, on_before_print=skipOdd,
+                elements=[RecordingFunction(texts=texts,
+                    func=lambda item: 'even {}'.format(item.i))]))
+
+    return EventsReport()
+
+
+class PageCountEventsTest(ReportTestCase):
+
+    def testEvents(self):
+        texts = []
+        report = eventsReport(texts)
+        report.render(self.printer(),
+            items=[Item(i, key=i // 3) for i in range(60)])
+        expected = []
+        for i in range(60):
+            expected += ['item {}'.format(i), str(i % 3 + 1)]
+            if i % 2 == 0:
+                expected.append('even {}'.format(i))
+        self.assertEqual(texts, expected)
+
+    def testDataItems(self):
+        texts = []
+        report = eventsReport(texts)
+        plan = RenderPlan(report)
+        self.assertNotIn(report.detail, plan.dataItemBands)
+        layout = LayoutRenderer(report, plan, keepDataItems=False).layout(
+            {'items': [Item(i, key=i // 3) for i in range(60)]})
+        self.assertEqual(set(item.dataItem for page, item in
+            layout.placements(report.detail)), set([None]))
+        report.paint(self.printer(), layout)
+        self.assertEqual(texts[:5], ['item 0', '1', 'even 0', 'item 1', '2'])
+
+
+class BandHeightTest(unittest.TestCase):
+
+    def testWithoutDataItem(self):
+        texts = ['one line']
+        band = Band(height=5 * mm, expand=True, elements=[Function(
+            expand=True, func=lambda item: texts[0])])
+        image = QImage(100, 100, QImage.Format_RGB32)
+        painter = QPainter(image)
+        painter.bandHeights = {}
+        try:
+            height = band.renderHeight(painter)
+            texts[0] = 'three\nlines\nnow'
+            self.assertGreater(band.renderHeight(painter), height)
+        finally:
+            painter.end()
+
+
+if __name__ == '__main__':
+    unittest.main()
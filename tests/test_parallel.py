@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Parallel rendering tests, skipped without pypdf.
+"""
+
+import unittest
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+from franq import Report, Band, DetailBand, Field, PageNumber, mm
+from franq.parallel import renderParallel
+
+from . import ReportTestCase, Item
+
+
+class ItemsReport(Report):
+    footer = Band(height=10 * mm, elements=[PageNumber(
+        formatStr='{page} of {pageCount}')])
+    detail = DetailBand(dataSet='items', height=6 * mm,
+        elements=[Field(attrName='name')])
+
+
+@unittest.skipIf(PdfReader is None, 'requires pypdf')
+class RenderParallelTest(ReportTestCase):
+
+    def testPages(self):
+        items = [Item(i) for i in range(300)]
+        serial = self.printer('serial.pdf')
+        ItemsReport().render(serial, items=items)
+        printer = self.printer('parallel.pdf')
+        layout = renderParallel(ItemsReport(), printer, {'items': items}, 2)
+        serialPages = PdfReader(serial.outputFileName()).pages
+        pages = PdfReader(printer.outputFileName()).pages
+        self.assertEqual(len(pages), layout.pageCount)
+        self.assertEqual([page.extract_text() for page in pages],
+            [page.extract_text() for page in serialPages])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Render plan tests.
+"""
+
+import unittest
+from unittest import mock
+
+from franq import (Report, Band, DetailBand, DetailGroup, Field, PageNumber,
+    mm)
+from franq.franq import RenderPlan
+
+from . import ReportTestCase
+
+
+class SetupReport(Report):
+
+    def setup(self):
+        self.footer = Band(height=10 * mm, elements=[PageNumber()])
+        self.detail = DetailBand(dataSet='items', height=5 * mm,
+            elements=[Field(attrName='name')])
+
+
+class RenderPlanTest(ReportTestCase):
+
+    def items(self):
+        return [{'name': 'name {}'.format(i)} for i in range(100)]
+
+    def testOncePerRender(self):
+        report = SetupReport()
+        with mock.patch('franq.franq.RenderPlan', wraps=RenderPlan) as build:
+            report.render(self.printer(), items=self.items())
+            self.assertEqual(build.call_count, 1)
+            # Shared by the layout and paint passes
+            report.footer.elements[0].formatStr = '{page} of {pageCount}'
+            report.render(self.printer(), items=self.items())
+            self.assertEqual(build.call_count, 2)
+
+    def testHeightChangedByEvent(self):
+        def setHeight(band, item):
+            report.detail.height = (10 if item['key'] == 'b' else 5) * mm
+
+        class HeightsReport(Report):
+            detail = DetailBand(dataSet='items', height=5 * mm,
+                groups=[DetailGroup(attrName='key', header=Band(
+                    height=5 * mm, on_before_print=setHeight))],
+                elements=[Field(attrName='key')])
+
+        report = HeightsReport()
+        layout = report.layout(items=[{'key': key} for key in 'aaabbbccc'])
+        rects = [item.rect for page, item in layout.placements()]
+        for rect, next in zip(rects, rects[1:]):
+            self.assertGreaterEqual(next.top(), rect.bottom() - 0.001)
+        self.assertEqual([round(item.rect.height() / mm) for page, item
+            in layout.placements(report.detail)], [5] * 3 + [10] * 3 + [5] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
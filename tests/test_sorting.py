@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Dataset sorting tests.
+"""
+
+import unittest
+
+from franq import (Report, Band, DetailBand, DetailGroup, Function, Sum,
+    mm)
+from franq.util import sortedItems
+
+from . import ReportTestCase, Item, RecordingAggregateField
+
+
+def groupTotalsReport(texts, sortBufferSize):
+    total = Sum('i')
+
+    class GroupTotalsReport(Report):
+        detail = DetailBand(dataSet='items', height=5 * mm, orderBy=True,
+            lookahead=True, sortBufferSize=sortBufferSize,
+            groups=[DetailGroup(attrName='key', aggregates=[total],
+                header=Band(height=5 * mm, elements=[
+                    RecordingAggregateField(texts=texts, aggregate=total)]))])
+
+    return GroupTotalsReport()
+
+
+class SortedItemsTest(unittest.TestCase):
+
+    def testSpilledRuns(self):
+        items = [(i * 7) % 100 for i in range(100)]
+        result = sortedItems(items, bufferSize=30)
+        self.assertNotIsInstance(result, list)
+        self.assertEqual(list(result), sorted(items))
+        # Iterable again, and while iterating
+        iterator = iter(result)
+        next(iterator)
+        self.assertEqual(list(result), sorted(items))
+        self.assertEqual(list(iterator), sorted(items)[1:])
+
+    def testStable(self):
+        items = [(i % 3, i) for i in range(50)]
+        key = lambda item: item[0]
+        self.assertEqual(list(sortedItems(items, key, 7)),
+            sorted(items, key=key))
+
+
+class OrderByTest(ReportTestCase):
+
+    def testLookaheadAboveBufferSize(self):
+        items = [Item(i, key='k{}'.format(i % 5)) for i in range(100)]
+        inMemory = []
+        groupTotalsReport(inMemory, 1000).render(self.printer('memory.pdf'),
+            items=items)
+        spilled = []
+        groupTotalsReport(spilled, 10).render(self.printer('spilled.pdf'),
+            items=items)
+        self.assertEqual(spilled, inMemory)
+        self.assertEqual(inMemory, ['950', '970', '990', '1010', '1030'])
+
+
+class RenderErrorTest(ReportTestCase):
+
+    def testPainterEnded(self):
+        def fail(item):
+            raise ValueError(item)
+
+        class FailingReport(Report):
+            detail = DetailBand(dataSet='items', height=5 * mm,
+                elements=[Function(func=fail)])
+
+        printer = self.printer()
+        self.assertRaises(ValueError, FailingReport().render, printer,
+            items=[1])
+        self.assertFalse(printer.paintingActive())
+
+
+if __name__ == '__main__':
+    unittest.main()
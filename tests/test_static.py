@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Static elements recording tests.
+"""
+
+import unittest
+
+from franq import Report, Band, DetailBand, DetailGroup, mm
+
+from . import ReportTestCase, RecordingLabel
+
+
+def labelReport(texts, **kw):
+    label = RecordingLabel(texts=texts, text='')
+
+    def setText(band, item):
+        label.text = 'item {}'.format(item)
+
+    # The label is changed by the event of another band
+    class LabelReport(Report):
+        detail = DetailBand(dataSet='items', height=5 * mm, elements=[label],
+            groups=[DetailGroup(lambda item: item, header=Band(
+                height=5 * mm, on_before_print=setText))], **kw)
+
+    return LabelReport()
+
+
+class StaticTest(ReportTestCase):
+
+    def testLabelChangedByEvent(self):
+        texts = []
+        labelReport(texts).render(self.printer(),
+            items=['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(texts, ['item a', 'item b', 'item c', 'item d',
+            'item e'])
+
+    def testRecorded(self):
+        texts = []
+        labelReport(texts, recordStatic=True).render(self.printer(),
+            items=['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(texts, ['item a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Franq reporting framework
+# Franq is (C)2012,2013 Julio César Gázquez
+#
+# Franq is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Franq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Franq; If not, see <http://www.gnu.org/licenses/>.
+"""
+    Subdetail tests.
+"""
+
+import unittest
+
+from franq import Report, DetailBand, mm
+
+from . import ReportTestCase, Item, RecordingField
+
+
+class BatchLoaderTest(ReportTestCase):
+
+    def testChildlessParents(self):
+        calls = []
+        texts = []
+
+        def load(keys):
+            calls.append(keys)
+            # Odd parents have no children
+            return {key: [{'name': 'child {}'.format(key)}]
+                for key in keys if key % 2 == 0}
+
+        class ParentsReport(Report):
+            detail = DetailBand(dataSet='parents', height=5 * mm,
+                subdetails=[DetailBand(batchLoader=load, batchSize=10,
+                    height=5 * mm, elements=[RecordingField(texts=texts,
+                        attrName='name')])])
+
+        ParentsReport().render(self.printer(),
+            parents=[Item(i, id=i) for i in range(20)])
+        self.assertEqual(calls, [list(range(10)), list(range(10, 20))])
+        self.assertEqual(texts,
+            ['child {}'.format(i) for i in range(0, 20, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()